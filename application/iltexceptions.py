@@ -35,3 +35,12 @@ class LicenseNameException(Exception):
     def __init__(self, license_name):
         self.message = f'There are no license with the "{license_name}" name.'
         super().__init__(self.message)
+
+
+class GitException(Exception):
+    """
+    Occurs if git could not list the files (e.g. git is not installed or the path is not inside a git repository).
+    """
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
@@ -0,0 +1,224 @@
+# ilt - insert license text
+# Copyright (C) 2023  imlystyi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+A module that matches paths against gitignore-style patterns.
+
+"""
+from re import escape, compile as compile_regex
+
+# region Fields
+
+GITIGNORE_NAME = '.gitignore'
+"""
+Name of the files with the ignore patterns of a folder.
+"""
+
+_WILDCARDS = frozenset('*?[\\')
+"""
+Characters that make a pattern a glob (instead of a literal).
+"""
+
+# endregion
+
+
+# region Classes
+
+class IgnoreMatcher:
+    """
+    Matcher compiled from a list of gitignore-style patterns (in which the last matching pattern wins), relative to a
+    base folder. Literal names ("build") and extension suffixes ("*.min.js", looked up at the dots of the name) are
+    looked up in dictionaries, and the rest of the patterns (e.g. "*~") are compiled into one regular expression, so
+    matching stays cheap with hundreds of patterns.
+    """
+    def __init__(self, patterns: list[str], base: str = ''):
+        """
+        :param patterns: List of gitignore-style patterns (blank lines and lines starting with "#" are skipped).
+        :param base: Path of the base folder relative to the root, with "/" separators and a trailing "/" (or "").
+
+        """
+        self.base = base
+        self._names, self._suffixes, alternatives = {}, {}, []
+
+        for index, pattern in enumerate(patterns):
+            parsed = _parse_pattern(pattern)
+
+            if parsed is None:
+                continue
+
+            negated, dir_only, anchored, body = parsed
+            rule = (index, negated, dir_only)
+
+            if not anchored and not any(char in _WILDCARDS for char in body):
+                self._names.setdefault(body, []).append(rule)
+            elif not anchored and body.startswith('*.') and not any(char in _WILDCARDS for char in body[1:]):
+                self._suffixes.setdefault(body[1:], []).append(rule)
+            else:
+                regex = ('' if anchored else '(?:.*/)?') + _translate(body) + ('/' if dir_only else '/?')
+                alternatives.append((index, regex, rule))
+
+        # The alternatives are ordered from the last pattern to the first one, so the first matching alternative (the
+        # only participating group) is the last matching pattern.
+        alternatives.sort(reverse=True)
+        self._regex = compile_regex('|'.join(f'({regex})' for _, regex, _ in alternatives)) if alternatives else None
+        self._groups = {group: rule for group, (_, _, rule) in enumerate(alternatives, 1)}
+
+    def match(self, path: str, is_dir: bool) -> bool | None:
+        """
+        Matches the specified path against the patterns.
+        :param path: Path relative to the root, with "/" separators.
+        :param is_dir: The path is a directory.
+        :return: True if the path is ignored, False if it is re-included by a negated pattern, None if no pattern
+        matches it.
+
+        """
+        if not path.startswith(self.base):
+            return None
+
+        path = path[len(self.base):]
+        name = path[path.rfind('/') + 1:]
+        best = None
+
+        for rule in self._names.get(name, ()):
+            best = _pick(best, rule, is_dir)
+
+        if self._suffixes:
+            index = name.find('.')
+
+            while index != -1:
+                for rule in self._suffixes.get(name[index:], ()):
+                    best = _pick(best, rule, is_dir)
+
+                index = name.find('.', index + 1)
+
+        if self._regex is not None:
+            found = self._regex.fullmatch(path + '/' if is_dir else path)
+
+            if found is not None:
+                best = _pick(best, self._groups[found.lastindex], is_dir)
+
+        return None if best is None else not best[1]
+
+# endregion
+
+
+# region Methods
+
+def is_ignored(matchers: tuple, path: str, is_dir: bool) -> bool:
+    """
+    Checks whether the specified path is ignored by the chain of matchers (a later matcher, e.g. of a deeper
+    ".gitignore" file, takes precedence over an earlier one).
+    :param matchers: Tuple of the matchers.
+    :param path: Path relative to the root, with "/" separators.
+    :param is_dir: The path is a directory.
+    :return: True if the path is ignored.
+
+    """
+    for matcher in reversed(matchers):
+        result = matcher.match(path, is_dir)
+
+        if result is not None:
+            return result
+
+    return False
+
+
+def read_gitignore(path: str, base: str) -> IgnoreMatcher | None:
+    """
+    Reads the ".gitignore" file with the specified path.
+    :param path: Path to the file.
+    :param base: Path of its folder relative to the root, with "/" separators and a trailing "/" (or "").
+    :return: Matcher of the patterns of the file (None if it cannot be read).
+
+    """
+    try:
+        with open(path, encoding='utf-8', errors='replace') as file:
+            return IgnoreMatcher(file.read().splitlines(), base)
+    except (OSError, IOError):
+        return None
+
+
+def _parse_pattern(pattern: str) -> tuple | None:
+    # Returns a tuple from the negation, directory-only and anchoring flags and the pattern body, or None if the line
+    # is blank or a comment.
+    pattern = pattern.rstrip()
+
+    if not pattern or pattern.startswith('#'):
+        return None
+
+    negated = pattern.startswith('!')
+
+    if negated or pattern.startswith('\\!') or pattern.startswith('\\#'):
+        pattern = pattern[1:]
+
+    dir_only = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+
+    # "**/name" matches at any depth, just like "name".
+    if pattern.startswith('**/') and '/' not in pattern[3:]:
+        pattern = pattern[3:]
+
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+
+    return (negated, dir_only, anchored, pattern) if pattern else None
+
+
+def _pick(best: tuple | None, rule: tuple, is_dir: bool) -> tuple | None:
+    if rule[2] and not is_dir:
+        return best
+
+    return rule if best is None or rule[0] > best[0] else best
+
+
+def _translate(pattern: str) -> str:
+    # Translates a glob (without the leading and trailing "/") into a regular expression, where "*" and "?" do not
+    # match "/", and "**" matches any number of folders.
+    regex, index = [], 0
+
+    while index < len(pattern):
+        char = pattern[index]
+
+        if pattern.startswith('**/', index):
+            regex.append('(?:.*/)?')
+            index += 3
+            continue
+        elif pattern.startswith('**', index):
+            regex.append('.*')
+            index += 2
+            continue
+        elif char == '*':
+            regex.append('[^/]*')
+        elif char == '?':
+            regex.append('[^/]')
+        elif char == '\\' and index + 1 < len(pattern):
+            index += 1
+            regex.append(escape(pattern[index]))
+        elif char == '[' and (end := pattern.find(']', index + 2)) != -1:
+            content = pattern[index + 1:end]
+
+            if content.startswith('!'):
+                content = '^' + content[1:]
+
+            regex.append('[' + content.replace('\\', '\\\\') + ']')
+            index = end
+        else:
+            regex.append(escape(char))
+
+        index += 1
+
+    return ''.join(regex)
+
+# endregion
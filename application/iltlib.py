@@ -17,52 +17,308 @@
 A module that provides file formatting for inserting license text into them.
 
 """
+import iltstats
+import iltwatch
 from iltexceptions import *
-from os.path import isdir, join, splitext
-from os import getcwd, walk
+from iltignore import GITIGNORE_NAME, IgnoreMatcher, is_ignored, read_gitignore
+from collections import deque
+from functools import lru_cache
+from os.path import abspath, basename, dirname, isdir, isfile, join, normpath, realpath, relpath, samefile, splitext
+from os import fsdecode, link, makedirs, remove, replace, scandir, sep, stat
+from re import IGNORECASE, MULTILINE, compile as compile_regex, escape
+from time import perf_counter
+from zlib import crc32
+
+try:
+    from os import copy_file_range
+except ImportError:  # Only available on Linux.
+    copy_file_range = None
+
+try:
+    from os import sendfile
+except ImportError:  # Not available on Windows.
+    sendfile = None
 
 # region Fields
 
-LICENSES = ["apache", "bsl", "bsd2", "bsd3", "agpl", "gpl2", "gpl3", "lgpl", "mit", "unlicense"]
+INSERTED = 'inserted'
+"""
+Status of a file into which the license text was inserted.
+"""
+
+SKIPPED = 'skipped'
+"""
+Status of a file that already starts with the license text (or has not changed since the previous run).
+"""
+
+BINARY = 'binary'
+"""
+Status of a file that was skipped because its content is binary.
+"""
+
+GENERATED = 'generated'
+"""
+Status of a file that was skipped because it is marked as generated.
+"""
+
+VALID = 'valid'
+"""
+Status of a checked file that starts with the license text.
+"""
+
+MISSING = 'missing'
+"""
+Status of a checked file that does not start with a comment.
+"""
+
+MISMATCHED = 'mismatched'
+"""
+Status of a checked file that starts with a comment that is not the license text.
+"""
+
+OUTDATED = 'outdated'
+"""
+Status of a checked file that starts with the license text with other parameters (e.g. an old year).
+"""
+
+UPDATED = 'updated'
+"""
+Status of a file whose outdated license text was replaced with the current one.
+"""
+
+_PENDING_PER_WORKER = 4
+"""
+Maximum number of queued insertion jobs per worker in the parallel mode.
+"""
+
+_LICENSE_TEXTS_PATH = join(dirname(abspath(__file__)), 'LICENSE_TEXTS')
+"""
+Path to the file with the license texts.
+"""
+
+_COMMENT_STYLES_PATH = join(dirname(abspath(__file__)), 'COMMENT_STYLES')
+"""
+Path to the built-in comment styles (next to this module).
+"""
+
+_SHEBANG_SIZE = 256
+"""
+Maximum number of bytes read to find the interpreter in the shebang line of a file without an extension.
+"""
+
+_INTERPRETER_VERSION_PATTERN = compile_regex(r'[\d.]+$')
+"""
+Pattern of the version suffix of an interpreter name (e.g. "3.11" in "python3.11").
+"""
+
+_PLACEHOLDER_PATTERN = compile_regex(r'\[(year|copyright_owner|special_line)]')
+"""
+Pattern of the placeholders in the license texts.
+"""
+
+_CHUNK_SIZE = 1024 * 1024
+"""
+Size of the chunks in which the file bodies are copied.
+"""
+
+_KERNEL_CHUNK_SIZE = 1024 * 1024 * 1024
+"""
+Maximum number of bytes copied by the kernel in one call (in the mirror mode).
+"""
+
+_HEAD_SIZE = 8 * 1024
+"""
+Number of leading bytes of a file that are read to detect its encoding, line endings and existing header.
+"""
+
+_BOMS = ((b'\xef\xbb\xbf', 'utf-8'), (b'\xff\xfe\x00\x00', 'utf-32-le'), (b'\x00\x00\xfe\xff', 'utf-32-be'),
+         (b'\xff\xfe', 'utf-16-le'), (b'\xfe\xff', 'utf-16-be'))
+"""
+Byte order marks and their encodings (UTF-32 marks must go before UTF-16 ones, which are their prefixes).
+"""
+
+_MAGIC_NUMBERS = (b'\x7fELF', b'\xca\xfe\xba\xbe', b'\xcf\xfa\xed\xfe', b'\xce\xfa\xed\xfe', b'\x89PNG', b'GIF8',
+                  b'\xff\xd8\xff', b'%PDF-', b'PK\x03\x04', b'\x1f\x8b', b'\xfd7zXZ', b'7z\xbc\xaf',
+                  b'\xd0\xcf\x11\xe0')
+"""
+Leading bytes of the common binary formats (executables, images, documents and archives).
+"""
+
+_GENERATED_PATTERN = compile_regex(rb'@generated\b|<auto-generated\b|^[ \t]*(?:#|//|/?\*|<!--|--|;|%|\'|!|\(\*)'
+                                   rb'[^\n]*generated\b[^\n]*\bdo not edit\b', IGNORECASE | MULTILINE)
+"""
+Pattern of the markers that the code generators write into generated files: "@generated", "<auto-generated>" or
+a comment line that says that the file is generated and must not be edited (e.g. "// Code generated by X. DO NOT
+EDIT."). A "do not edit" remark alone (e.g. about a constant) does not mark a file as generated.
+"""
+
+_GENERATED_WINDOW = 1024
+"""
+Number of leading bytes (after the byte order mark) of a file that are searched for the generated file markers.
+"""
+
+_HEADER_CACHE_SIZE = 256
+"""
+Maximum number of rendered headers kept in the cache.
+"""
+
+MANIFEST_NAME = '.ilt-manifest'
+"""
+Default name of the incremental run manifest, which is placed in the root folder.
+"""
+
+_MANIFEST_VERSION = 1
+"""
+Version of the incremental run manifest format.
+"""
+
+JOURNAL_NAME = '.ilt-journal'
+"""
+Default name of the undo journal, which is placed in the root folder.
+"""
+
+RUN_JOURNAL_NAME = '.ilt-run'
+"""
+Default name of the run journal of the durable mode (in the root folder).
+"""
+
+CHECKPOINT_NAME = '.ilt-checkpoint'
+"""
+Default name of the checkpoint of an interrupted run (in the root folder).
+"""
+
+_CHECKPOINT_VERSION = 1
+"""
+Version of the checkpoint format. A checkpoint of another version is ignored.
+"""
+
+_DURABLE_BATCH_SIZE = 256
+"""
+Number of inserted files that are staged in the durable mode before they are committed together.
+"""
+
+_REPORT_VERSION = 1
+"""
+Version of the result report format.
+"""
+
+_UNKNOWN_SAMPLES = 3
+"""
+Maximum number of sample paths kept for each unknown extension.
+"""
+
+_comment_registry = None
+"""
+Comment styles, compiled into the dictionaries of the file names, the extensions and the interpreters (None until
+they are first used).
+"""
+
+_license_registry = None
 """
-List of licenses that are currently available in ilt "auto" mode.
+Dictionary of the parsed license templates, loaded on the first use.
 """
 
 # endregion
 
 
+def __getattr__(name: str):
+    if name == 'LICENSES':
+        # List of licenses that are currently available in ilt "auto" mode.
+        return list(_get_license_registry())
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
 # region Methods
 
 def auto_insert(license_text: str, root: str, ignored_exts: list[str] = None,
-                ignored_dirs: list[str] = None) -> (list[str], list[str]):
+                ignored_dirs: list[str] = None, workers: int = 1, processes: bool = False, manifest: str = None,
+                use_gitignore: bool = False, git: bool = False, since: str = None, journal: str = None,
+                output: str = None, shard: tuple[int, int] = None, run_journal: str = None,
+                checkpoint: str = None) -> (list[str], list[str], list[tuple[str, str]], dict[str, list]):
     """
     Automatically inserts the specified license text into the specified files.
     :param license_text: Specified license text to be inserted into the files.
     :param root: Path to the root folder.
     :param ignored_exts: List of ignored file extensions.
-    :param ignored_dirs: List of ignored directories.
-    :return: Tuple pair from the list of successfully formatted files and the list of unknown extensions list.
+    :param ignored_dirs: List of ignored directories (gitignore-style patterns, e.g. "build", "**/gen/**",
+    "*.min.js" or "!keep.min.js", a plain name matches at any depth).
+    :param workers: Number of parallel workers (1 means serial insertion).
+    :param processes: Use a process pool instead of a thread pool for the parallel workers.
+    :param manifest: Path to the incremental run manifest. Files that have not changed since they were recorded
+    in it are skipped without being opened, and it is rewritten with the state of the processed files.
+    :param use_gitignore: Also ignore the files matched by the ".gitignore" files found in the tree.
+    :param git: Take the files from the git index (only tracked files) instead of walking the tree.
+    :param since: Git revision: take only the files added or modified since it (implies the git mode).
+    :param journal: Path to the undo journal, to which the inserted headers are appended (see "undo_journal").
+    :param output: Path to the output root folder. If specified, the files are left untouched, and the licensed copies
+    are written into the same relative paths in it, while the other walked files (e.g. with unknown extensions) are
+    hardlinked (or copied) into it as they are. Files skipped by the manifest are expected to be in it already.
+    :param shard: Tuple pair from the 1-based index of the shard and the number of shards: only the files whose
+    relative path hashes into the shard are processed, so the shards of independent runs are disjoint (each shard
+    needs its own manifest).
+    :param run_journal: Path to the run journal, which enables the durable mode: the licensed files are written
+    into staged copies next to them, and each batch of them is flushed to the disk, renamed over the files, and
+    recorded in the run journal once their folders are flushed too. After a crash, every file is either intact or
+    fully licensed, and the run journal lists the committed batches (it is rewritten by every run).
+    :param checkpoint: Path to the checkpoint of the run, to which the finished files are appended. If the run is
+    interrupted, the same run (with the same license text, root and selection of the files) skips the files recorded
+    in it without opening them. It is deleted when the run is finished.
+    :return: Tuple from the list of successfully formatted files, the list of skipped files (that already start with
+    the license text or have not changed since the previous run), the list of skipped non-text files (pairs of the
+    file and its status, binary or generated) and the dictionary of the unknown extensions (see "iter_auto_insert").
 
     """
-    root = _get_correct_path(root)
-    files = _get_files(root, ignored_dirs)
-    success, unknown_exts = [], []
+    success, skipped, non_text, unknown_exts = [], [], [], {}
 
-    for file in files:
-        _, ext = splitext(file)
+    for file, status in iter_auto_insert(license_text, root, ignored_exts, ignored_dirs, workers, processes, manifest,
+                                         use_gitignore, git, since, journal, output, shard, unknown_exts,
+                                         run_journal, checkpoint):
+        _add_result(file, status, success, skipped, non_text)
 
-        if ignored_exts is not None and ext in ignored_exts:
-            continue
+    return success, skipped, non_text, unknown_exts
+
+
+def check_headers(license_name: str, root: str, year='', copyright_holder='', special_line='',
+                  ignored_exts: list[str] = None, ignored_dirs: list[str] = None, workers: int = 1,
+                  processes: bool = False, use_gitignore: bool = False, git: bool = False, since: str = None,
+                  shard: tuple[int, int] = None) -> (list[str], list[str], list[str], list[str], list[tuple[str, str]]):
+    """
+    Checks (without writing anything) that the files start with the license text, reading only their leading bytes.
+    The license is specified by its name and parameters (instead of its text), so that a header of the same license
+    with other parameters can be recognized as outdated.
+    :param license_name: License name.
+    :param root: Path to the root folder.
+    :param year: Year in the license text.
+    :param copyright_holder: Copyright holder name in the license text.
+    :param special_line: Special line in the license text.
+    :param ignored_exts: List of ignored file extensions.
+    :param ignored_dirs: List of ignored directories (gitignore-style patterns, as in "auto_insert").
+    :param workers: Number of parallel workers (1 means serial checking).
+    :param processes: Use a process pool instead of a thread pool for the parallel workers.
+    :param use_gitignore: Also ignore the files matched by the ".gitignore" files found in the tree.
+    :param git: Take the files from the git index (only tracked files) instead of walking the tree.
+    :param since: Git revision: take only the files added or modified since it (implies the git mode).
+    :param shard: Tuple pair from the 1-based index of the shard and the number of shards (as in "auto_insert").
+    :return: Tuple from the list of valid files, the list of files without a header, the list of files with
+    another header (starting with a comment), the list of files with the header of the license with other
+    parameters and the list of non-text files that were not checked (pairs of the file and its status, binary or
+    generated).
 
-        comment = _get_comment(ext)
+    """
+    license_text = get_license_text(license_name, year, copyright_holder, special_line)
+    root = _get_correct_path(root)
+    results, non_text = {VALID: [], MISSING: [], MISMATCHED: [], OUTDATED: []}, []
+    candidates = _discover(root, ignored_exts, ignored_dirs, use_gitignore, git, since, {}, shard=shard)
+    jobs = ((license_name, special_line != '', license_text, file, comment) for file, comment in candidates)
 
-        if comment == '':
-            unknown_exts.append(ext)
-        else:
-            if special_file_insert(license_text, file, comment):
-                success.append(file)
+    for (_, _, _, file, _), status in _map_ordered(_check_file, jobs, workers, processes):
+        if status in results:
+            results[status].append(file)
+        elif status in (BINARY, GENERATED):
+            non_text.append((file, status))
 
-    return success, unknown_exts
+    return results[VALID], results[MISSING], results[MISMATCHED], results[OUTDATED], non_text
 
 
 def get_license_text(license_name: str, year='', copyright_holder='', special_line='') -> str:
@@ -75,130 +331,1511 @@ def get_license_text(license_name: str, year='', copyright_holder='', special_li
     :return: License text.
 
     """
-    text = ''
+    collector = iltstats.collector
+    start = collector and perf_counter()
+    templates = _get_license_registry().get(license_name)
 
-    with open(getcwd() + r'\LICENSE_TEXTS') as file:
-        copy = False
+    if templates is None:
+        raise LicenseNameException(license_name)
 
-        for line in file:
-            if line[0] == ';':
-                continue
-            elif line.strip() == license_name:
-                copy = True
-            elif line.strip() == '+end':
-                copy = False
-            elif copy:
-                text += line.strip() + '\n'
+    # Without a special line, the first line of the license (which holds the special line) is dropped.
+    template = templates[0] if special_line != '' else templates[1]
+    values = {'year': '' if year == 0 else str(year), 'copyright_owner': copyright_holder,
+              'special_line': special_line}
+    license_text = ''.join(values[part] if index % 2 else part for index, part in enumerate(template))
 
-    lines = text.splitlines()
+    if collector is not None:
+        _measure(collector, 'template', start)
 
-    if len(lines) == 0:
-        raise LicenseNameException(license_name)
-    elif lines and not lines[-1].strip():
-        lines.pop()
+    return license_text
 
-    license_text = '\n'.join(lines)
 
-    if year == 0:
-        license_text = license_text .replace('[year]', '').replace('[copyright_owner]', copyright_holder)
-    else:
-        license_text = license_text.replace('[year]', str(year)).replace('[copyright_owner]', copyright_holder)
+def iter_auto_insert(license_text: str, root: str, ignored_exts: list[str] = None,
+                     ignored_dirs: list[str] = None, workers: int = 1, processes: bool = False, manifest: str = None,
+                     use_gitignore: bool = False, git: bool = False, since: str = None, journal: str = None,
+                     output: str = None, shard: tuple[int, int] = None, unknown_exts: dict[str, list] = None,
+                     run_journal: str = None, checkpoint: str = None, progress: dict[str, int] = None):
+    """
+    Automatically inserts the specified license text into the specified files, yielding the result of each file as
+    soon as it is known, so that huge trees are processed in bounded memory. The parameters are the same as in
+    "auto_insert", except for:
+    :param unknown_exts: Dictionary into which the files with unknown extensions are counted, as the pairs of the
+    number of files and a few sample paths by the extension (e.g. {".md": [120, ["README.md", ...]]}).
+    :param progress: Dictionary that is kept up to date with the number of the files with known extensions ("total"),
+    and the number and the size in bytes of the reported files ("files" and "bytes"), e.g. for displaying the speed
+    and the remaining time. The files are then counted by a first walk of the tree (which keeps no paths) before the
+    first file is processed, so that the total is known.
+    :return: Generator of the pairs of a file and its status (inserted, skipped, binary or generated). In the
+    durable mode, the inserted files are reported once their batch is committed.
 
-    if special_line != '':
-        license_text = license_text.replace('[special_line]', special_line)
-    else:
-        license_text = license_text.split('\n', 1)[1]
+    """
+    root = _get_correct_path(root)
+    previous, current, prefix = {}, {}, len(join(root, ''))
 
-    return license_text
+    if manifest is not None:
+        manifest = _get_correct_path(manifest)
+        previous = _load_manifest(manifest)
+
+    if journal is not None:
+        journal = _get_correct_path(journal)
+
+    if run_journal is not None:
+        run_journal = _get_correct_path(run_journal)
+
+    if checkpoint is not None:
+        checkpoint = _get_correct_path(checkpoint)
+
+    unmatched = None
+
+    if output is not None:
+        output, unmatched = _get_correct_path(output), []
+        ignored_dirs = _exclude_output(root, output, ignored_dirs)
+
+    unknown_exts, ready = {} if unknown_exts is None else unknown_exts, deque()
+    candidates = _discover(root, ignored_exts, ignored_dirs, use_gitignore, git, since, unknown_exts,
+                           (manifest, journal, run_journal, checkpoint), unmatched, shard)
+
+    if progress is not None:
+        total = sum(1 for _ in _discover(root, ignored_exts, ignored_dirs, use_gitignore, git, since, None,
+                                         (manifest, journal, run_journal, checkpoint), shard=shard))
+        progress.update(total=total, files=0, bytes=0)
+
+    done, writer = set(), None
+
+    if checkpoint is not None:
+        from json import dumps
+
+        fingerprint = _get_digest(dumps([license_text, root, ignored_exts, ignored_dirs, use_gitignore, git, since,
+                                         output, shard]).encode('utf-8'))
+        done, writer = _open_checkpoint(checkpoint, fingerprint)
+
+    staged, staging = run_journal is not None, {}
+
+    def jobs():
+        for file, comment in candidates:
+            target = output and join(output, file[prefix:])
+
+            if file[prefix:] in done:
+                # A file finished before the run was interrupted (its manifest entry is still up to date).
+                if manifest is not None and file[prefix:] in previous:
+                    current[file[prefix:]] = previous[file[prefix:]]
+
+                ready.append(file)
+
+                if iltstats.collector is not None:
+                    iltstats.collector.count(SKIPPED)
+            elif staged and target is None and _is_staging(file, staging):
+                ready.append(file)
+
+                if iltstats.collector is not None:
+                    iltstats.collector.count(SKIPPED)
+            elif manifest is None:
+                yield license_text, file, comment, True, True, journal, target, staged
+            else:
+                key, entry = file[prefix:], _get_manifest_entry(license_text, file, comment)
+
+                if previous.get(key) == entry and (target is None or isfile(target)):
+                    current[key] = entry
+                    ready.append(file)
+
+                    if iltstats.collector is not None:
+                        iltstats.collector.count(SKIPPED)
+                else:
+                    yield license_text, file, comment, True, True, journal, target, staged
+
+    def results():
+        for (_, file, comment, _, _, _, target, _), status in _map_ordered(_insert_file, jobs(), workers, processes):
+            # The files skipped by the manifest are reported as soon as the next processed file.
+            while ready:
+                yield ready.popleft(), None, SKIPPED
+
+            if manifest is not None:
+                # A staged copy keeps its size and modification time when it is renamed over the file.
+                entry_file = _get_staged_path(file) if staged and target is None and status == INSERTED else file
+                current[file[prefix:]] = _get_manifest_entry(license_text, entry_file, comment)
+
+            yield file, target or file, status
+
+        while ready:
+            yield ready.popleft(), None, SKIPPED
+
+    try:
+        for file, status in _commit_results(results(), run_journal, workers, output is not None):
+            if writer is not None and file[prefix:] not in done:
+                writer.write(dumps(file[prefix:]) + '\n')
+
+            if progress is not None:
+                progress['files'] += 1
+                progress['bytes'] += _get_size(file)
+
+            if staging:
+                _release(file, staging)
+
+            yield file, status
+
+        if output is not None:
+            _link_files(root, output, unmatched, workers, processes)
+
+        if writer is not None:
+            writer.close()
+            writer = None
+
+            try:
+                remove(checkpoint)
+            except OSError:
+                pass
+    finally:
+        if writer is not None:
+            writer.close()
+
+        if manifest is not None:
+            _save_manifest(manifest, current)
+
+
+def load_comment_styles(path: str) -> None:
+    """
+    Loads the comment styles from the specified file (in the format of the built-in "COMMENT_STYLES" file), which
+    override the built-in ones from then on.
+    :param path: Path to the file.
+
+    """
+    _parse_comment_styles(_get_correct_path(path), _get_comment_registry())
+
+
+def merge_reports(paths: list[str]) -> (str, dict[str, list], list[int]):
+    """
+    Merges the result reports of the shards of one run (see "save_report") into one.
+    :param paths: List of paths to the reports.
+    :return: Tuple from the command of the run, the dictionary of the merged result lists (in the order of the
+    shards) and the list of the 1-based indexes of the missing shards.
+
+    """
+    from json import load
+
+    command, count, merged, indexes = None, None, {}, set()
+
+    for path in paths:
+        try:
+            with open(path, encoding='utf-8') as file:
+                report = load(file)
+        except (OSError, IOError):
+            raise FileException(f'Failed file access: {path} (OSError/IOError).')
+        except ValueError:
+            raise FileException(f'Invalid report: {path}.')
+
+        if not isinstance(report, dict) or report.get('version') != _REPORT_VERSION:
+            raise FileException(f'Invalid report: {path}.')
+
+        index, shard_count = report['shard'] or (1, 1)
+
+        if command is not None and (report['command'] != command or shard_count != count):
+            raise FileException(f'The report does not belong to the same run: {path}.')
+        elif index in indexes:
+            raise FileException(f'The report of the shard {index}/{shard_count} is repeated: {path}.')
+
+        command, count = report['command'], shard_count
+        indexes.add(index)
+        merged[index] = report['results']
+
+    results = {}
+
+    for index in sorted(merged):
+        for name, items in merged[index].items():
+            if isinstance(items, dict):  # Counters of the unknown extensions.
+                for ext, (number, files) in items.items():
+                    _count_unknown(results.setdefault(name, {}), ext, files, number)
+            else:
+                results.setdefault(name, []).extend(tuple(item) if isinstance(item, list) else item for item in items)
+
+    return command, results, [index for index in range(1, (count or 0) + 1) if index not in indexes]
+
+
+def save_report(path: str, command: str, results: dict[str, list], shard: tuple[int, int] = None) -> None:
+    """
+    Saves the results of a run (e.g. of a shard) as a JSON report, so that the reports of the shards can be merged.
+    :param path: Path to the report.
+    :param command: Name of the command of the run (only the reports of the same command are merged).
+    :param results: Dictionary of the result lists (e.g. "success" and "unknown_exts").
+    :param shard: Tuple pair from the 1-based index of the shard and the number of shards (None if not sharded).
+
+    """
+    from json import dump
+
+    try:
+        with open(path, 'w', encoding='utf-8') as file:
+            dump({'version': _REPORT_VERSION, 'command': command, 'shard': shard, 'results': results}, file,
+                 separators=(',', ':'))
+    except (OSError, IOError):
+        raise FileException(f'Failed file access: {path} (OSError/IOError).')
 
 
 def special_ext_insert(license_text: str, root: str,
-                       searched_ext: list[str], comment: str, ignored_dirs: list[str]) -> list[str]:
+                       searched_ext: str | dict[str, str], comment: str, ignored_dirs: list[str],
+                       workers: int = 1, processes: bool = False, use_gitignore: bool = False,
+                       journal: str = None, output: str = None, shard: tuple[int, int] = None,
+                       run_journal: str = None) -> (list[str], list[str], list[tuple[str, str]]):
     """
-    Inserts the specified license text into files with the specified extension and comment format.
+    Inserts the specified license text into files with the specified extensions and comment formats, walking the tree
+    once for all of them.
     :param license_text: Specified license text to be inserted into the files.
     :param root: Path to the root folder.
-    :param searched_ext: List of searched file extensions.
-    :param comment: Comment format in files with the searched extension.
-    :param ignored_dirs: List of ignored directories.
-    :return: List of successfully formatted files.
+    :param searched_ext: Searched file extension, or a dictionary of the searched file extensions and their comment
+    formats (e.g. {".foo": "#", ".bar": "/* * */"}).
+    :param comment: Comment format in files with the searched extension (ignored if the extensions are a dictionary).
+    :param ignored_dirs: List of ignored directories (gitignore-style patterns, as in "auto_insert").
+    :param workers: Number of parallel workers (1 means serial insertion).
+    :param processes: Use a process pool instead of a thread pool for the parallel workers.
+    :param use_gitignore: Also ignore the files matched by the ".gitignore" files found in the tree.
+    :param journal: Path to the undo journal, to which the inserted headers are appended (see "undo_journal").
+    :param output: Path to the output root folder, into which the licensed copies and the other walked files are
+    written instead of changing the files (as in "auto_insert").
+    :param shard: Tuple pair from the 1-based index of the shard and the number of shards (as in "auto_insert").
+    :param run_journal: Path to the run journal, which enables the durable mode (as in "auto_insert").
+    :return: Tuple from the list of successfully formatted files, the list of skipped files (that already start with
+    the license text) and the list of skipped non-text files (pairs of the file and its status, binary or generated).
 
     """
     root = _get_correct_path(root)
-    files = _get_files(root, ignored_dirs)
-    success = []
+    output = output and _get_correct_path(output)
+    files = _get_files(root, _exclude_output(root, output, ignored_dirs) if output else ignored_dirs, use_gitignore)
+    files = files if shard is None else _filter_shard(root, files, shard)
+    success, skipped, non_text, unmatched = [], [], [], []
+    journal = journal and _get_correct_path(journal)
+    run_journal = run_journal and _get_correct_path(run_journal)
+    prefix, staging = len(join(root, '')), {}
+    comments = searched_ext if isinstance(searched_ext, dict) else {searched_ext: comment}
+
+    def jobs():
+        for file in files:
+            _, ext = splitext(file)
 
-    for file in files:
-        _, ext = splitext(file)
+            if _is_temporary(file) or file in (journal, run_journal):
+                continue
+            elif ext in comments and run_journal is not None and not output and _is_staging(file, staging):
+                skipped.append(file)
+            elif ext in comments:
+                yield license_text, file, comments[ext], True, True, journal, output and join(output, file[prefix:]), \
+                    run_journal is not None
+            elif output:
+                unmatched.append(file)
+
+    results = ((file, target or file, status) for (_, file, _, _, _, _, target, _), status
+               in _map_ordered(_insert_file, jobs(), workers, processes))
+
+    for file, status in _commit_results(results, run_journal, workers, bool(output)):
+        if staging:
+            _release(file, staging)
+
+        _add_result(file, status, success, skipped, non_text)
 
-        if ext == searched_ext:
-            if special_file_insert(license_text, file, comment):
-                success.append(file)
+    if output:
+        _link_files(root, output, unmatched, workers, processes)
 
-    return success
+    return success, skipped, non_text
 
 
-def special_file_insert(license_text: str, file: str, comment: str) -> bool:
+def special_file_insert(license_text: str, file: str, comment: str, skip_licensed: bool = False,
+                        journal: str = None, durable: bool = False) -> bool:
     """
     Inserts the specified license text into the specified file with the specified comment format.
     :param license_text: Specified license text to be inserted into the file.
     :param file: Path to the file.
     :param comment: Comment format in the file.
-    :return: Formatting success.
+    :param skip_licensed: Do not insert the license text if the file already starts with it.
+    :param journal: Path to the undo journal, to which the inserted header is appended (see "undo_journal").
+    :param durable: Flush the licensed file and its folder to the disk before returning.
+    :return: Formatting success (False if the file was skipped).
 
     """
     file = _get_correct_path(file)
-    try:
-        license_lines = license_text.split('\n')
-        header = '\n'.join([comment + ' ' + line for line in license_lines])
+    status = _insert_file(license_text, file, comment, skip_licensed, False, journal and _get_correct_path(journal),
+                          None, durable)
 
-        with open(file, 'r+') as io:
-            content = io.read()
-            content = '\n' + content
+    if durable and status == INSERTED:
+        _commit([file], 1)
 
-            io.seek(0)
+    return status == INSERTED
 
-            io.write(header + content)
 
-        return True
+def undo_journal(journal: str, workers: int = 1, processes: bool = False) -> (list[str], list[str]):
+    """
+    Strips the headers recorded in the specified undo journal out of the files, latest first. Only the recorded bytes
+    are removed, and only if they are still the recorded header, so a file changed since the insertion is left
+    as it is. The journal is deleted if all the headers were stripped.
+    :param journal: Path to the undo journal.
+    :param workers: Number of parallel workers (1 means serial undoing).
+    :param processes: Use a process pool instead of a thread pool for the parallel workers.
+    :return: Tuple pair from the list of restored files and the list of files that could not be restored (changed or
+    inaccessible).
+
+    """
+    from json import loads
+
+    journal = _get_correct_path(journal)
+    records = {}
+
+    try:
+        with open(journal, encoding='utf-8') as io:
+            lines = io.read().splitlines()
     except (OSError, IOError):
-        raise FileException(f'Failed file access: {file} (OSError/IOError).')
+        raise FileException(f'Failed file access: {journal} (OSError/IOError).')
 
+    for line in reversed(lines):
+        try:
+            file, offset, length, fingerprint = loads(line)
+        except ValueError:  # A record that was cut off by an interrupted run.
+            continue
 
-def _get_comment(ext: str) -> str:
-    match ext:
-        case '.c' | '.cc' | '.cpp' | '.cxx' | '.cs' | '.dpr' | '.drc' | '.go' | '.java' | '.js' | '.php' | '.swift' \
-             | '.ts':
-            return '//'
-        case '.f' | '.for' | '.f90':
-            return '!'
-        case '.py' | '.pyc' | '.pyi' | '.rb':
-            return '#'
-        case '.vb':
-            return '\''
-        case _:
-            return ''
+        records.setdefault(file, []).append((offset, length, fingerprint))
 
+    restored, failed = [], []
 
-def _get_correct_path(path: str) -> str:
-    return path.replace('/', '\\')
+    for (file, _), success in _map_ordered(_undo_file, records.items(), workers, processes):
+        (restored if success else failed).append(file)
 
+    if not failed:
+        try:
+            remove(journal)
+        except OSError:
+            pass
 
-def _get_files(path: str, ignored_dirs: list[str] = None) -> list[str]:
-    if not isdir(path):
+    return restored, failed
+
+
+def update_headers(license_name: str, root: str, year='', copyright_holder='', special_line='',
+                   ignored_exts: list[str] = None, ignored_dirs: list[str] = None, workers: int = 1,
+                   processes: bool = False, use_gitignore: bool = False, git: bool = False, since: str = None,
+                   shard: tuple[int, int] = None) -> (list[str], list[str], list[str]):
+    """
+    Replaces the outdated headers of the license (with other parameters, e.g. an old year or copyright holder) with
+    the license text with the specified parameters. A header of the same length in bytes is patched in place, so the
+    rest of the file is not touched; otherwise the file is rewritten in chunks.
+    :param license_name: License name.
+    :param root: Path to the root folder.
+    :param year: Year in the license text.
+    :param copyright_holder: Copyright holder name in the license text.
+    :param special_line: Special line in the license text.
+    :param ignored_exts: List of ignored file extensions.
+    :param ignored_dirs: List of ignored directories (gitignore-style patterns, as in "auto_insert").
+    :param workers: Number of parallel workers (1 means serial updating).
+    :param processes: Use a process pool instead of a thread pool for the parallel workers.
+    :param use_gitignore: Also ignore the files matched by the ".gitignore" files found in the tree.
+    :param git: Take the files from the git index (only tracked files) instead of walking the tree.
+    :param since: Git revision: take only the files added or modified since it (implies the git mode).
+    :param shard: Tuple pair from the 1-based index of the shard and the number of shards (as in "auto_insert").
+    :return: Tuple from the list of updated files, the list of files that already start with the license text and
+    the list of files without the header of the license (binary and generated files are not updated).
+
+    """
+    license_text = get_license_text(license_name, year, copyright_holder, special_line)
+    root = _get_correct_path(root)
+    updated, valid, unlicensed = [], [], []
+    candidates = _discover(root, ignored_exts, ignored_dirs, use_gitignore, git, since, {}, shard=shard)
+    jobs = ((license_name, special_line != '', license_text, file, comment) for file, comment in candidates)
+
+    for (_, _, _, file, _), status in _map_ordered(_update_file, jobs, workers, processes):
+        if status == UPDATED:
+            updated.append(file)
+        elif status == VALID:
+            valid.append(file)
+        elif status in (MISSING, MISMATCHED):
+            unlicensed.append(file)
+
+    return updated, valid, unlicensed
+
+
+def watch_insert(license_text: str, root: str, ignored_exts: list[str] = None, ignored_dirs: list[str] = None,
+                 debounce: float = 0.5, polling: bool = False, interval: float = 1.0):
+    """
+    Watches the specified folder and inserts the specified license text into the new files with known extensions
+    as they appear. Bursts of new files are handled together once no file has appeared or been written for the
+    debounce time, and files that already start with the license text (e.g. copied from a licensed file) are
+    skipped, as well as binary and generated files.
+    :param license_text: Specified license text to be inserted into the files.
+    :param root: Path to the root folder.
+    :param ignored_exts: List of ignored file extensions.
+    :param ignored_dirs: List of ignored directories (gitignore-style patterns, as in "auto_insert"). The ".git"
+    folder is always ignored.
+    :param debounce: Time in seconds without new events after which the new files are formatted.
+    :param polling: Rescan the tree at a fixed interval instead of using inotify (which is used if it is available).
+    :param interval: Interval between the rescans in seconds (only when polling).
+    :return: Generator of the (file, status) pairs of the new files (as in "iter_auto_insert"), which watches until
+    it is closed. The root is validated immediately.
+
+    """
+    root = _get_correct_path(root)
+
+    if not isdir(root):
         raise FileException('Invalid path.')
+
+    matchers = (IgnoreMatcher(['.git/', *(ignored_dirs or [])]),)
+    prefix = len(join(root, ''))
+    written = {}
+
+    def prune(directory: str) -> bool:
+        # The watcher prunes from the top, so only the folder itself has to be matched.
+        return len(directory) > len(root) and is_ignored(matchers, directory[prefix:].replace(sep, '/'), True)
+
+    def results():
+        for files in iltwatch.watch(root, prune, debounce, polling, interval):
+            for file in files:
+                _, ext = splitext(file)
+
+                # The file replaced by the insertion itself is reported again (by inotify), unless it was changed
+                # since (e.g. removed and created again).
+                if written.pop(file, None) == _get_identity(file):
+                    continue
+
+                if ignored_exts is not None and ext in ignored_exts or \
+                        _is_path_ignored(matchers, file[prefix:].replace(sep, '/')) or not isfile(file):
+                    continue
+
+                comment = _get_comment(file, ext)
+
+                if comment != '':
+                    try:
+                        status = _insert_file(license_text, file, comment, True, True)
+                    except FileException:  # The file was removed (e.g. a temporary file of an editor) or is locked.
+                        continue
+
+                    if status == INSERTED:
+                        written[file] = _get_identity(file)
+
+                    yield file, status
+
+    return results()
+
+
+def _add_result(file: str, status: str, success: list, skipped: list, non_text: list) -> None:
+    if status == INSERTED:
+        success.append(file)
+    elif status == SKIPPED:
+        skipped.append(file)
     else:
-        files = []
+        non_text.append((file, status))
 
-        for dirpath, dirnames, filenames in walk(path):
-            for name in filenames:
-                if ignored_dirs is None:
-                    files.append(join(dirpath, name))
-                else:
-                    for dirname in ignored_dirs:
-                        if dirpath.rfind(dirname) == -1:
-                            files.append(join(dirpath, name))
 
-        return files
+def _check_file(license_name: str, has_special_line: bool, license_text: str, file: str, comment: str) -> str:
+    file = _get_correct_path(file)
+
+    try:
+        return _find_header(license_name, has_special_line, license_text, file, comment)[0]
+    except (OSError, IOError):
+        raise FileException(f'Failed file access: {file} (OSError/IOError).')
+
+
+def _count_unknown(unknown_exts: dict[str, list], ext: str, files: list[str], count: int = 1) -> None:
+    counter = unknown_exts.get(ext)
+
+    if counter is None:
+        unknown_exts[ext] = [count, files[:_UNKNOWN_SAMPLES]]
+    else:
+        counter[0] += count
+        counter[1].extend(files[:_UNKNOWN_SAMPLES - len(counter[1])])
+
+
+def _discover(root: str, ignored_exts: list[str] | None, ignored_dirs: list[str] | None, use_gitignore: bool,
+              git: bool, since: str | None, unknown_exts: dict[str, list] | None, excluded: tuple = (),
+              unmatched: list = None, shard: tuple[int, int] = None):
+    # Returns a generator of the (file, comment format) pairs of the files with known extensions, counting the unknown
+    # extensions into the specified dictionary, if it is specified (and, if the list is specified, adding the files
+    # with unknown or ignored extensions to it). The root is validated immediately.
+    files = _get_git_files(root, ignored_dirs, since) if git or since is not None \
+        else _get_files(root, ignored_dirs, use_gitignore)
+    files = files if shard is None else _filter_shard(root, files, shard)
+
+    def candidates():
+        for file in files:
+            _, ext = splitext(file)
+
+            if file in excluded or _is_temporary(file):
+                continue
+
+            if ignored_exts is not None and ext in ignored_exts:
+                if unmatched is not None:
+                    unmatched.append(file)
+
+                continue
+
+            comment = _get_comment(file, ext)
+
+            if comment != '':
+                yield file, comment
+            elif unknown_exts is not None:
+                _count_unknown(unknown_exts, ext, [file])
+
+                if unmatched is not None:
+                    unmatched.append(file)
+
+                if iltstats.collector is not None:
+                    iltstats.collector.count('unknown')
+
+    return candidates()
+
+
+def _find_header(license_name: str, has_special_line: bool, license_text: str, file: str, comment: str) -> tuple:
+    # Returns a tuple from the status of the file (as in "check_headers"), the offset of the header (after the byte
+    # order mark and the shebang line), the current header and the length of the existing header in bytes (0 unless
+    # the file is outdated).
+    head = _read_head(file)
+    bom, encoding, newline = _get_text_format(head)
+    offset = _get_header_offset(head, bom, encoding)
+
+    if status := _sniff(head, bom, encoding):
+        return status, offset, b'', 0
+
+    header = _render_header(license_text, comment, encoding, newline)
+
+    if _starts_with(file, head, offset, header):
+        return VALID, offset, header, 0
+
+    # The existing header may be a bit longer than the current one, so enough bytes are read to match it whole.
+    if len(head) == _HEAD_SIZE < offset + 2 * len(header):
+        head = _read_head(file, offset + 2 * len(header))
+
+    text = head[offset:].decode(encoding, 'replace')
+    found = _get_header_pattern(license_name, has_special_line, comment).match(text)
+
+    if found is not None:
+        return OUTDATED, offset, header, len(text[:found.end()].encode(encoding))
+
+    return (MISMATCHED if text.lstrip().startswith(_get_comment_style(comment)[0] or comment) else MISSING), offset, \
+        header, 0
+
+
+def _filter_shard(root: str, files, shard: tuple[int, int]):
+    # The files are assigned to the shards by the CRC-32 of their path relative to the root (with "/" separators), so
+    # the assignment does not depend on the platform, the walk order or the other files.
+    index, count = shard
+
+    if not 1 <= index <= count:
+        raise ValueError(f'Invalid shard: {index}/{count}.')
+
+    prefix = len(join(root, ''))
+
+    return (file for file in files
+            if crc32(file[prefix:].replace(sep, '/').encode('utf-8', 'surrogateescape')) % count == index - 1)
+
+
+def _get_comment(file: str, ext: str) -> str:
+    # Looks the comment format up by the exact file name, then by the extension and, for the files without an
+    # extension, by the interpreter in the shebang line. Returns "" if the file is unknown.
+    names, exts, interpreters = _get_comment_registry()
+    comment = names.get(basename(file)) or exts.get(ext) or exts.get(ext.lower())
+
+    if comment is None and ext == '' and interpreters:
+        comment = interpreters.get(_get_interpreter(file))
+
+    return comment or ''
+
+
+def _get_interpreter(file: str) -> str | None:
+    # Reads the interpreter name (without the version) from the shebang line, e.g. "python" from "#!/usr/bin/python3"
+    # or "#!/usr/bin/env -S python3 -u". Rust inner attributes ("#![...]") are not shebang lines.
+    try:
+        with open(file, 'rb') as io:
+            line = io.read(_SHEBANG_SIZE).split(b'\n', 1)[0]
+    except (OSError, IOError):
+        return None
+
+    if not line.startswith(b'#!') or line.startswith(b'#!['):
+        return None
+
+    words = line[2:].decode('utf-8', 'replace').split()
+
+    if words and basename(words[0]) == 'env':
+        words = [word for word in words[1:] if not word.startswith('-') and '=' not in word]
+
+    return _INTERPRETER_VERSION_PATTERN.sub('', basename(words[0])) if words else None
+
+
+def _get_comment_registry() -> tuple[dict, dict, dict]:
+    global _comment_registry
+
+    if _comment_registry is None:
+        _comment_registry = ({}, {}, {})
+        _parse_comment_styles(_COMMENT_STYLES_PATH, _comment_registry)
+
+    return _comment_registry
+
+
+def _parse_comment_styles(path: str, registry: tuple[dict, dict, dict]) -> None:
+    # Adds the lines of a comment styles file to the dictionaries of the file names, the extensions and the
+    # interpreters. Lines starting with ";" are comments.
+    names, exts, interpreters = registry
+
+    try:
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                comment, separator, keys = line.strip().rpartition(' = ')
+
+                if line[0] == ';' or not separator or not comment.strip():
+                    continue
+
+                for key in keys.split():
+                    if key.startswith('!'):
+                        interpreters[key[1:]] = comment.strip()
+                    elif key.startswith('.'):
+                        exts[key] = comment.strip()
+                    else:
+                        names[key] = comment.strip()
+    except (OSError, IOError):
+        raise FileException(f'Failed file access: {path} (OSError/IOError).')
+
+
+def _get_comment_style(comment: str) -> tuple[str, str, str]:
+    # Splits a comment format into the start line, the line prefix and the end line of the header: "#" is a line
+    # comment, "<!-- -->" is a block comment and "/* * */" is a block comment with a line prefix.
+    parts = comment.split()
+
+    if len(parts) == 2:
+        return parts[0], '', parts[1]
+    elif len(parts) == 3:
+        return parts[0], ' ' + parts[1] + ' ', ' ' + parts[2]
+
+    return '', comment + ' ', ''
+
+
+def _get_comment_lines(lines: list[str], comment: str) -> list[str]:
+    start, prefix, end = _get_comment_style(comment)
+    lines = [prefix + line for line in lines]
+
+    return [start, *lines, end] if start else lines
+
+
+def _get_header_offset(head: bytes, bom: bytes, encoding: str) -> int:
+    # The header is inserted after the byte order mark and the shebang line (which must stay the first line of
+    # a script), or at the end of a file that is only a shebang line without a line ending (see "_insert"). Rust
+    # inner attributes ("#![...]") are not shebang lines.
+    shebang, line_feed = '#!'.encode(encoding), '\n'.encode(encoding)
+
+    if not head.startswith(shebang, len(bom)) or head.startswith('#!['.encode(encoding), len(bom)):
+        return len(bom)
+
+    index = head.find(line_feed, len(bom))
+
+    if index == -1:
+        return len(head) if len(head) < _HEAD_SIZE else len(bom)
+
+    return index + len(line_feed)
+
+
+def _map_ordered(function, jobs, workers: int = 1, processes: bool = False):
+    # Yields (job, result) pairs in the order of the jobs, so the results and the first raised exception are the
+    # same as in a serial run. Only a few jobs per worker are queued, so lazily produced jobs stay lazy.
+    if workers <= 1:
+        for job in jobs:
+            yield job, function(*job)
+
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    executor = (ProcessPoolExecutor if processes else ThreadPoolExecutor)(max_workers=workers)
+    pending = deque()
+
+    try:
+        for job in jobs:
+            pending.append((job, executor.submit(function, *job)))
+
+            if len(pending) >= workers * _PENDING_PER_WORKER:
+                job, future = pending.popleft()
+                yield job, future.result()
+
+        while pending:
+            job, future = pending.popleft()
+            yield job, future.result()
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def _get_license_registry() -> dict[str, tuple]:
+    global _license_registry
+
+    if _license_registry is None:
+        _license_registry = _parse_license_texts(_LICENSE_TEXTS_PATH)
+
+    return _license_registry
+
+
+def _parse_license_texts(path: str) -> dict[str, tuple]:
+    # Each license block starts with a line holding its name and ends with a "+end" line, lines starting with ";"
+    # are comments. Every license is compiled into a pair of templates (with and without the first line), where
+    # a template is a tuple alternating between literal text and placeholder names.
+    registry = {}
+
+    try:
+        with open(path, encoding='utf-8') as file:
+            name, lines = None, []
+
+            for line in file:
+                if line[0] == ';':
+                    continue
+                elif name is None:
+                    name = line.strip() or None
+                elif line.strip() == '+end':
+                    if lines and not lines[-1]:
+                        lines.pop()
+
+                    if lines:
+                        registry[name] = (tuple(_PLACEHOLDER_PATTERN.split('\n'.join(lines))),
+                                          tuple(_PLACEHOLDER_PATTERN.split('\n'.join(lines[1:]))))
+
+                    name, lines = None, []
+                else:
+                    lines.append(line.strip())
+    except (OSError, IOError):
+        raise FileException(f'Failed file access: {path} (OSError/IOError).')
+
+    return registry
+
+
+@lru_cache(maxsize=_HEADER_CACHE_SIZE)
+def _render_header(license_text: str, comment: str, encoding: str = 'utf-8', newline: str = '\n') -> bytes:
+    # The license text already holds the license name, year, copyright holder and special line, so each header is
+    # rendered and encoded once per license text, comment format, encoding and line ending, including the line
+    # ending separating it from the body.
+    return ''.join([line + newline for line in _get_comment_lines(license_text.split('\n'), comment)]).encode(encoding)
+
+
+def _insert_file(license_text: str, file: str, comment: str, skip_licensed: bool = False,
+                 skip_non_text: bool = False, journal: str = None, target: str = None, staged: bool = False) -> str:
+    file = _get_correct_path(file)
+    collector = iltstats.collector
+
+    try:
+        status = _insert(license_text, file, comment, skip_licensed, skip_non_text, journal, target, staged,
+                         collector)
+
+        if target is not None and status != INSERTED:
+            _link(file, target)
+    except (OSError, IOError):
+        if collector is not None:
+            collector.count('errors')
+
+        raise FileException(f'Failed file access: {file} (OSError/IOError).')
+
+    if collector is not None:
+        collector.count('files')
+        collector.count(status)
+
+    return status
+
+
+def _insert(license_text: str, file: str, comment: str, skip_licensed: bool, skip_non_text: bool,
+            journal: str | None, target: str | None, staged: bool, collector: iltstats.Stats | None) -> str:
+    start = collector and perf_counter()
+    head = _read_head(file)
+    bom, encoding, newline = _get_text_format(head)
+    status = _sniff(head, bom, encoding) if skip_non_text else ''
+
+    if collector is not None:
+        start = _measure(collector, 'read', start)
+        collector.count('bytes_read', len(head))
+
+    if status:
+        return status
+
+    header = _render_header(license_text, comment, encoding, newline)
+    offset = _get_header_offset(head, bom, encoding)
+
+    if offset == len(head) > len(bom) and not head.endswith('\n'.encode(encoding)):
+        # The file is only a shebang line without a line ending, which is ended before the header (so the line ending
+        # is a part of the recorded header and is stripped with it by "undo_journal").
+        header = newline.encode(encoding) + header
+
+    if collector is not None:
+        start = _measure(collector, 'render', start)
+
+    if skip_licensed and _starts_with(file, head, offset, header):
+        return SKIPPED
+
+    if target is None:
+        size = _prepend(file, offset, header, staged=staged)
+    else:
+        size = _mirror(file, target, offset, header, staged)
+
+    if journal is not None:
+        _record(journal, target or file, offset, header)
+
+    if collector is not None:
+        _measure(collector, 'write', start)
+        collector.count('bytes_read', size)
+        collector.count('bytes_written', size + len(header))
+
+    return INSERTED
+
+
+def _update_file(license_name: str, has_special_line: bool, license_text: str, file: str, comment: str) -> str:
+    file = _get_correct_path(file)
+    collector = iltstats.collector
+    start = collector and perf_counter()
+
+    try:
+        status, offset, header, length = _find_header(license_name, has_special_line, license_text, file, comment)
+
+        if collector is not None:
+            start = _measure(collector, 'read', start)
+
+        if status == OUTDATED:
+            if length == len(header):
+                _overwrite(file, offset, header)
+                size, written = 0, len(header)
+            else:
+                size = _prepend(file, offset, header, length)
+                written = size - length + len(header)
+
+            status = UPDATED
+
+            if collector is not None:
+                _measure(collector, 'write', start)
+                collector.count('bytes_read', size)
+                collector.count('bytes_written', written)
+    except (OSError, IOError):
+        if collector is not None:
+            collector.count('errors')
+
+        raise FileException(f'Failed file access: {file} (OSError/IOError).')
+
+    if collector is not None:
+        collector.count('files')
+        collector.count(status)
+
+    return status
+
+
+def _measure(collector: iltstats.Stats, stage: str, start: float) -> float:
+    # Adds the time passed since the start to the stage and returns the current time (the start of the next stage).
+    now = perf_counter()
+    collector.time(stage, now - start)
+
+    return now
+
+
+def _sniff(head: bytes, bom: bytes, encoding: str) -> str:
+    # Classifies a file by its leading bytes: a known magic number or a NUL byte (outside of UTF-16/32 files) means
+    # a binary file, and a generated file marker near the start means a generated one. Returns "" for text files.
+    if not bom and (head.startswith(_MAGIC_NUMBERS) or b'\0' in head):
+        return BINARY
+
+    window = head[len(bom):len(bom) + _GENERATED_WINDOW * len('\n'.encode(encoding))]
+
+    if encoding not in ('utf-8', 'ascii'):
+        window = window.decode(encoding, 'ignore').encode()
+
+    if _GENERATED_PATTERN.search(window):
+        return GENERATED
+
+    return ''
+
+
+@lru_cache(maxsize=_HEADER_CACHE_SIZE)
+def _get_header_pattern(license_name: str, has_special_line: bool, comment: str):
+    # Pattern of the header of the license with any parameters: the placeholders match anything up to the end of
+    # their line, and any line ending is accepted.
+    templates = _get_license_registry()[license_name]
+    text = ''.join('\0' if index % 2 else part
+                   for index, part in enumerate(templates[0] if has_special_line else templates[1]))
+    lines = ['[^\r\n]*'.join(escape(piece) for piece in line.split('\0'))
+             for line in _get_comment_lines(text.split('\n'), comment)]
+
+    return compile_regex('(?:\r\n|\n|\r)'.join(lines) + '(?:\r\n|\n|\r)')
+
+
+def _read_head(file: str, size: int = _HEAD_SIZE) -> bytes:
+    with open(file, 'rb') as io:
+        return io.read(size)
+
+
+def _get_text_format(head: bytes) -> (bytes, str, str):
+    # Detects the byte order mark, the encoding and the line ending of a file from its leading bytes. Files without
+    # a byte order mark are treated as UTF-8 (which also covers ASCII-compatible legacy encodings for the header).
+    bom, encoding = b'', 'utf-8'
+
+    for mark, mark_encoding in _BOMS:
+        if head.startswith(mark):
+            bom, encoding = mark, mark_encoding
+            break
+
+    line_feed, carriage_return = '\n'.encode(encoding), '\r'.encode(encoding)
+    index = head.find(line_feed, len(bom))
+
+    if index == -1:
+        newline = '\r' if head.find(carriage_return, len(bom)) != -1 else '\n'
+    elif head[index - len(carriage_return):index] == carriage_return:
+        newline = '\r\n'
+    else:
+        newline = '\n'
+
+    return bom, encoding, newline
+
+
+def _prepend(file: str, offset: int, header: bytes, removed: int = 0, staged: bool = False) -> int:
+    # Writes the first offset bytes (the byte order mark and the shebang line), the header and then the original body
+    # (without the next removed bytes, e.g. an outdated header), copied verbatim in fixed-size chunks, into a temporary
+    # file in the same directory, which then atomically replaces the original file, so it is never left half-written.
+    # A staged file is left next to the original one to be committed later (see "_commit"). A symbolic link is
+    # resolved, so the file it points to is licensed and the link is kept. Returns the size of the original file.
+    from shutil import copymode
+    from tempfile import mkstemp
+
+    file = realpath(file)
+
+    if staged:
+        descriptor = temp = _get_staged_path(file)  # Opened (and truncated, if left by a crashed run) by its path.
+    else:
+        descriptor, temp = mkstemp(prefix='.ilt-', suffix='.tmp', dir=dirname(file))
+
+    try:
+        with open(file, 'rb') as source, open(descriptor, 'wb') as target:
+            target.write(source.read(offset))
+            target.write(header)
+            source.seek(offset + removed)
+            size = offset + removed + _copy(source, target)
+
+        copymode(file, temp)
+
+        if not staged:
+            _replace(temp, file)
+
+        return size
+    except BaseException:
+        try:
+            remove(temp)
+        except OSError:
+            pass
+
+        raise
+
+
+def _replace(temp: str, file: str, durable: bool = False) -> None:
+    # Replaces the file with the complete temporary file, keeping its owner (if it can be changed). A file with several
+    # hard links is rewritten in place instead, so that all its links are licensed; a crash during the copy can leave
+    # it half-written, with the complete temporary file still next to it. In the durable mode, the rewritten file is
+    # flushed to the disk before the temporary file is removed, so a crash after it cannot lose both of them.
+    status = stat(file)
+
+    if status.st_nlink > 1:
+        with open(temp, 'rb') as source, open(file, 'r+b') as target:
+            _copy(source, target)
+            target.truncate()
+
+            if durable:
+                from os import fsync
+
+                target.flush()
+                fsync(target.fileno())
+
+        remove(temp)
+        return
+
+    temp_status = stat(temp)
+
+    if (temp_status.st_uid, temp_status.st_gid) != (status.st_uid, status.st_gid):
+        from os import chown
+
+        try:
+            chown(temp, status.st_uid, status.st_gid)
+        except OSError:
+            pass
+
+    replace(temp, file)
+
+
+def _mirror(file: str, target: str, offset: int, header: bytes, staged: bool = False) -> int:
+    # Writes the first offset bytes (the byte order mark and the shebang line) and the header into the target file (or
+    # its staged copy, see "_commit"), and then lets the kernel copy the body, so it does not pass through Python
+    # memory. Returns the size of the original file.
+    from shutil import copymode
+
+    # The staged copy is renamed over the previous target file, which is then not written through either.
+    target = _get_staged_path(target) if staged else target
+    _unlink(target)
+
+    with open(file, 'rb') as source, open(target, 'wb') as io:
+        io.write(source.read(offset))
+        io.write(header)
+        io.flush()
+        size = _copy_range(source, io, offset)
+
+    copymode(file, target)
+
+    return size
+
+
+def _copy_range(source, target, offset: int) -> int:
+    # Copies the source file from the offset to its end at the position of the target file with "copy_file_range"
+    # (Linux), then "sendfile", then in chunks, each one continuing from where the previous one stopped (e.g. when the
+    # files are on different file systems). Returns the end offset.
+    source_descriptor, target_descriptor = source.fileno(), target.fileno()
+
+    try:
+        if copy_file_range is not None:
+            while size := copy_file_range(source_descriptor, target_descriptor, _KERNEL_CHUNK_SIZE, offset):
+                offset += size
+
+            return offset
+    except OSError:
+        pass
+
+    try:
+        if sendfile is not None:
+            while size := sendfile(target_descriptor, source_descriptor, offset, _KERNEL_CHUNK_SIZE):
+                offset += size
+
+            return offset
+    except OSError:
+        pass
+
+    source.seek(offset)
+
+    return offset + _copy(source, target)
+
+
+def _commit_results(results, run_journal: str | None, workers: int, mirror: bool = False):
+    # Turns the (file, written path, status) results of an insertion into (file, status) pairs. In the durable mode,
+    # the results are held back until the batch of their staged files is committed, and the staged files of the last
+    # batch are committed even if the run stops early (they are complete once their results are known). The written
+    # paths of the mirror mode are the output files.
+    if run_journal is None:
+        for file, _, status in results:
+            yield file, status
+
+        return
+
+    try:
+        open(run_journal, 'w').close()
+    except (OSError, IOError):
+        raise FileException(f'Failed file access: {run_journal} (OSError/IOError).')
+
+    batch, held, staged = 0, [], []
+
+    try:
+        for file, path, status in results:
+            held.append((file, status))
+
+            if status == INSERTED:
+                staged.append(path)
+
+            if len(staged) == _DURABLE_BATCH_SIZE:
+                batch += 1
+                _commit(staged, workers, run_journal, batch, mirror)
+                staged, committed, held = [], held, []
+
+                yield from committed
+    finally:
+        if staged:
+            _commit(staged, workers, run_journal, batch + 1, mirror)
+
+    yield from held
+
+
+def _commit(paths: list[str], workers: int, run_journal: str = None, batch: int = 0, mirror: bool = False) -> None:
+    # Commits a batch of staged files: they are flushed to the disk together (in parallel, so the flushes overlap),
+    # then renamed over the files (the files behind symbolic links; files with several hard links are rewritten in
+    # place and flushed, see "_replace"; the output files of the mirror mode are always renamed over, since they may
+    # be hard links of the original files), then each of their folders is flushed once (so the renames are durable
+    # too), and the batch is finally recorded in the run journal.
+    # Paths of the same file (e.g. a symbolic link and its target) share one staged copy, which is committed once.
+    from json import dumps
+
+    try:
+        files = {_get_staged_path(path): realpath(path) for path in paths}
+
+        for _ in _map_ordered(_sync, ((temp,) for temp in files), workers):
+            pass
+
+        for temp, file in files.items():
+            if mirror:
+                replace(temp, file)
+            else:
+                _replace(temp, file, True)
+
+        for directory in dict.fromkeys(dirname(file) for file in files.values()):
+            _sync(directory, True)
+
+        if run_journal is not None:
+            with open(run_journal, 'a', encoding='utf-8') as io:
+                io.write(dumps([batch, [abspath(path) for path in paths]]) + '\n')
+
+            _sync(run_journal)
+    except (OSError, IOError):
+        raise FileException(f'Failed to commit a batch of {len(paths)} file(s) (OSError/IOError).')
+
+
+def _sync(path: str, is_dir: bool = False) -> None:
+    # Flushes the file or the folder to the disk (files are opened for writing, which Windows requires for flushing).
+    # Folders cannot be opened on Windows, where the renames are flushed with the files.
+    from os import O_RDONLY, O_RDWR, close, fsync, open as open_descriptor
+
+    try:
+        descriptor = open_descriptor(path, O_RDONLY if is_dir else O_RDWR)
+    except PermissionError:
+        if is_dir:
+            return
+
+        raise
+
+    try:
+        fsync(descriptor)
+    finally:
+        close(descriptor)
+
+
+def _get_staged_path(path: str) -> str:
+    # The staged copy is in the same folder as the file behind the path (so it can be renamed over it) under a name
+    # derived from the file, so the process that commits it does not have to be told it.
+    path = realpath(path)
+
+    return join(dirname(path), f'.ilt-{basename(path)}.tmp')
+
+
+def _is_staging(file: str, staging: dict[str, str]) -> bool:
+    # Returns True if another path of the same file (e.g. a symbolic link to it) is staged and not committed yet, since
+    # both would be written into the same staged copy; the file is skipped then (once that copy is committed, the file
+    # starts with the license text anyway). Otherwise, the file is recorded as staged by its path until it is released.
+    return staging.setdefault(realpath(file), file) != file
+
+
+def _release(file: str, staging: dict[str, str]) -> None:
+    # Forgets the staged file once its result is reported (after its batch is committed), so only the files of the
+    # uncommitted batches are kept.
+    path = realpath(file)
+
+    if staging.get(path) == file:
+        del staging[path]
+
+
+def _is_temporary(file: str) -> bool:
+    name = basename(file)
+
+    return name.startswith('.ilt-') and name.endswith('.tmp')
+
+
+def _link_files(root: str, output: str, files: list[str], workers: int, processes: bool) -> None:
+    prefix = len(join(root, ''))
+    jobs = ((file, join(output, file[prefix:])) for file in files)
+
+    for (file, _), error in _map_ordered(_link_file, jobs, workers, processes):
+        if error:
+            raise FileException(f'Failed file access: {file} (OSError/IOError).')
+
+
+def _link_file(file: str, target: str) -> bool:
+    # Returns True if the file could not be linked or copied (exceptions are not raised inside the workers).
+    try:
+        _link(file, target)
+    except (OSError, IOError):
+        return True
+
+    return False
+
+
+def _link(file: str, target: str) -> None:
+    # Hardlinks the file as it is into the output folder, or copies it if hardlinks are not supported (e.g. on another
+    # file system). A target that is already a link of the file is kept.
+    from shutil import copy2
+
+    try:
+        if samefile(file, target):
+            return
+    except OSError:
+        pass
+
+    _unlink(target)
+
+    try:
+        link(file, target)
+    except OSError:
+        copy2(file, target)
+
+
+def _unlink(target: str) -> None:
+    # Removes the previous target file (which may be a hardlink of the original file, so it must not be overwritten)
+    # and creates its folders.
+    try:
+        remove(target)
+    except FileNotFoundError:
+        makedirs(dirname(target), exist_ok=True)
+
+
+def _exclude_output(root: str, output: str, ignored_dirs: list[str] | None) -> list[str] | None:
+    # Adds the output folder to the ignored directories if it is inside the root folder, so it is not walked.
+    try:
+        path = relpath(output, root)
+    except ValueError:  # On different drives.
+        return ignored_dirs
+
+    if path == '.':
+        raise FileException('The output folder must differ from the root folder.')
+    elif path.startswith('..'):
+        return ignored_dirs
+
+    return [*(ignored_dirs or []), '/' + path.replace(sep, '/') + '/']
+
+
+def _overwrite(file: str, offset: int, header: bytes) -> None:
+    # Patches the bytes of a header of the same length in place, so the body is neither read nor written.
+    with open(file, 'r+b') as io:
+        io.seek(offset)
+        io.write(header)
+
+
+def _copy(source, target) -> int:
+    buffer = bytearray(_CHUNK_SIZE)
+    view = memoryview(buffer)
+    total = 0
+
+    while size := source.readinto(buffer):
+        target.write(view[:size])
+        total += size
+
+    return total
+
+
+def _starts_with(file: str, head: bytes, offset: int, header: bytes) -> bool:
+    # Only the leading bytes of the file are read, so checking an already licensed file costs one small read.
+    if len(head) == _HEAD_SIZE < offset + len(header):
+        with open(file, 'rb') as io:
+            head = io.read(offset + len(header))
+
+    return head[offset:offset + len(header)] == header
+
+
+def _record(journal: str, file: str, offset: int, header: bytes) -> None:
+    # Appends the record of an inserted header to the undo journal. Each record is a single short write in the append
+    # mode, so the records of parallel threads and processes are not interleaved.
+    from json import dumps
+
+    with open(journal, 'a', encoding='utf-8') as io:
+        io.write(dumps([abspath(file), offset, len(header), _get_digest(header)]) + '\n')
+
+
+def _undo_file(file: str, records: list[tuple]) -> bool:
+    # Strips the recorded headers (latest first) out of the file, checking that each of them is still in place.
+    try:
+        for offset, length, digest in records:
+            with open(file, 'rb') as io:
+                head = io.read(offset + length)
+
+            if len(head) != offset + length or _get_digest(head[offset:]) != digest:
+                return False
+
+            _prepend(file, offset, b'', length)
+    except (OSError, IOError):
+        return False
+
+    return True
+
+
+@lru_cache(maxsize=_HEADER_CACHE_SIZE)
+def _get_digest(data: bytes) -> str:
+    from hashlib import blake2b
+
+    return blake2b(data, digest_size=16).hexdigest()
+
+
+@lru_cache(maxsize=_HEADER_CACHE_SIZE)
+def _get_fingerprint(license_text: str, comment: str) -> str:
+    return _get_digest(_render_header(license_text, comment))
+
+
+def _get_manifest_entry(license_text: str, file: str, comment: str) -> list:
+    try:
+        status = stat(file)
+    except OSError:
+        return []
+
+    return [status.st_size, status.st_mtime_ns, _get_fingerprint(license_text, comment)]
+
+
+def _load_manifest(path: str) -> dict[str, list]:
+    # The manifest is only a cache, so a missing, unreadable or outdated manifest means a full run.
+    from json import load
+
+    try:
+        with open(path, encoding='utf-8') as file:
+            data = load(file)
+    except (OSError, IOError, ValueError):
+        return {}
+
+    if not isinstance(data, dict) or data.get('version') != _MANIFEST_VERSION:
+        return {}
+
+    return data.get('files', {})
+
+
+def _save_manifest(path: str, files: dict[str, list]) -> None:
+    from json import dump
+    from tempfile import mkstemp
+
+    descriptor, temp = mkstemp(prefix='.ilt-', suffix='.tmp', dir=dirname(path))
+
+    try:
+        with open(descriptor, 'w', encoding='utf-8') as file:
+            dump({'version': _MANIFEST_VERSION, 'files': files}, file, separators=(',', ':'))
+
+        replace(temp, path)
+    except (OSError, IOError):
+        try:
+            remove(temp)
+        except OSError:
+            pass
+
+        raise FileException(f'Failed file access: {path} (OSError/IOError).')
+
+
+def _open_checkpoint(path: str, fingerprint: str) -> (set[str], object):
+    # Returns the set of the files recorded in the checkpoint of the same run and the checkpoint opened for appending.
+    # The checkpoint of another run (or of another version, or unreadable) is started over. The first line of the
+    # checkpoint is the pair of its version and the fingerprint of the run, and each next line is a relative path.
+    from json import dumps, loads
+
+    done, text = set(), ''
+
+    try:
+        with open(path, encoding='utf-8') as io:
+            text = io.read()
+
+        lines = text.splitlines()
+
+        if lines and loads(lines[0]) == [_CHECKPOINT_VERSION, fingerprint]:
+            for line in lines[1:]:
+                try:
+                    done.add(loads(line))
+                except ValueError:  # A record that was cut off by a killed run.
+                    continue
+    except (OSError, IOError, ValueError):
+        pass
+
+    try:
+        if done:
+            writer = open(path, 'a', encoding='utf-8')
+
+            if not text.endswith('\n'):
+                writer.write('\n')
+
+            return done, writer
+
+        writer = open(path, 'w', encoding='utf-8')
+        writer.write(dumps([_CHECKPOINT_VERSION, fingerprint]) + '\n')
+
+        return done, writer
+    except (OSError, IOError):
+        raise FileException(f'Failed file access: {path} (OSError/IOError).')
+
+
+def _get_identity(file: str) -> tuple[int, int] | None:
+    try:
+        status = stat(file)
+    except OSError:
+        return None
+
+    return status.st_ino, status.st_mtime_ns
+
+
+def _get_size(file: str) -> int:
+    try:
+        return stat(file).st_size
+    except OSError:
+        return 0
+
+
+def _get_correct_path(path: str) -> str:
+    return normpath(path)
+
+
+def _get_files(path: str, ignored_dirs: list[str] = None, use_gitignore: bool = False):
+    if not isdir(path):
+        raise FileException('Invalid path.')
+    else:
+        matchers = (IgnoreMatcher(['.git/']),) if use_gitignore else ()
+
+        return _walk(path, IgnoreMatcher(ignored_dirs) if ignored_dirs else None, matchers, use_gitignore)
+
+
+def _get_git_files(path: str, ignored_dirs: list[str] = None, since: str = None):
+    # Lists the tracked files (or the files added or modified since the revision) with the local git binary. Git
+    # prints the paths relative to the folder it runs in, with "/" separators, sorted and NUL-terminated.
+    from subprocess import PIPE, run
+
+    if not isdir(path):
+        raise FileException('Invalid path.')
+
+    if since is None:
+        command = ['git', 'ls-files', '-z', '--cached']
+    else:
+        command = ['git', 'diff', '--name-only', '-z', '--relative', '--no-renames', '--diff-filter=AM', since, '--']
+
+    try:
+        process = run(command, cwd=path, stdout=PIPE, stderr=PIPE)
+    except OSError:
+        raise GitException('Failed to run git (is it installed?).')
+
+    if process.returncode != 0:
+        raise GitException(f'git failed: {fsdecode(process.stderr).strip()}')
+
+    matchers = (IgnoreMatcher(ignored_dirs),) if ignored_dirs else ()
+
+    return (join(path, normpath(name)) for name in map(fsdecode, process.stdout.split(b'\0'))
+            if name and not (matchers and _is_path_ignored(matchers, name)) and isfile(join(path, name)))
+
+
+def _is_path_ignored(matchers: tuple, path: str) -> bool:
+    # Checks the folders of the path from the top, since an ignored folder also ignores everything inside it.
+    index = path.find('/')
+
+    while index != -1:
+        if is_ignored(matchers, path[:index], True):
+            return True
+
+        index = path.find('/', index + 1)
+
+    return is_ignored(matchers, path, False)
+
+
+def _walk(path: str, matcher: IgnoreMatcher | None, gitignores: tuple, use_gitignore: bool):
+    # Depth-first walk that yields files lazily. Ignored entries are matched once (directories are pruned before
+    # descending into them) against the specified patterns and then the ".gitignore" files of the folder and its
+    # parents, deepest first. The entries of every directory are sorted, so the order of the files is the same on
+    # every run.
+    stack = [(path, '', gitignores)]
+
+    while stack:
+        dirs = []
+        collector = iltstats.collector
+        start = collector and perf_counter()
+        directory, base, gitignores = stack.pop()
+
+        try:
+            with scandir(directory) as iterator:
+                entries = sorted(iterator, key=lambda entry: entry.name)
+        except OSError:
+            continue
+
+        if use_gitignore and any(entry.name == GITIGNORE_NAME for entry in entries):
+            gitignore = read_gitignore(join(directory, GITIGNORE_NAME), base)
+            gitignores = gitignores + (gitignore,) if gitignore is not None else gitignores
+
+        matchers = gitignores + (matcher,) if matcher is not None else gitignores
+
+        if collector is not None:
+            _measure(collector, 'discovery', start)
+            collector.count('directories')
+
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+
+                if matchers and is_ignored(matchers, base + entry.name, is_dir):
+                    continue
+                elif is_dir:
+                    dirs.append((entry.path, base + entry.name + '/', gitignores))
+                elif entry.is_file():
+                    yield entry.path
+            except OSError:
+                continue
+
+        stack.extend(reversed(dirs))
 
 # endregion
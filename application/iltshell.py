@@ -18,9 +18,13 @@ A simple shell for the "ilt" application.
 
 """
 import iltlib as lib
+import iltstats as stats
 from cmd import Cmd
 from enum import Enum
+from os import cpu_count
+from os.path import dirname, join
 from re import findall
+from time import perf_counter
 from iltexceptions import *
 
 
@@ -33,11 +37,36 @@ class Shell(Cmd):
     # region Fields
 
     _IGNORE_DIRS_KEY = '-d'
+    _GITIGNORE_KEY = '-i'
+    _GIT_KEY = '-g'
+    _SINCE_KEY = '--since'
     _IGNORE_EXTS_KEY = '-e'
     _NO_UNKNOWN_EXTS_LIST_KEY = '-u'
     _NO_FILES_LIST_KEY = '-f'
+    _WORKERS_KEY = '-w'
+    _PROCESSES_KEY = '-p'
+    _MANIFEST_KEY = '-m'
+    _JOURNAL_KEY = '-j'
+    _OUTPUT_KEY = '-o'
+    _SHARD_KEY = '--shard'
+    _REPORT_KEY = '--report'
+    _COMMENTS_KEY = '--comments'
+    _POLL_KEY = '--poll'
+    _DEBOUNCE_KEY = '--debounce'
+    _DURABLE_KEY = '--durable'
+    _PROGRESS_KEY = '--progress'
+    _CHECKPOINT_KEY = '--checkpoint'
+    _PROGRESS_INTERVAL = 0.5
     _SPECIAL_EXTS_MODE = 'ext'
     _SPECIAL_FILE_MODE = 'file'
+    _STATS_ON_MODE = 'on'
+    _STATS_OFF_MODE = 'off'
+    _STATS_RESET_MODE = 'reset'
+    _STATS_JSON_MODE = 'json'
+    _REPORT_FIELDS = {'auto': ('success', 'skipped', 'non_text', 'unknown_exts'),
+                      'check': ('valid', 'missing', 'mismatched', 'outdated', 'non_text'),
+                      'special': ('success', 'skipped', 'non_text'),
+                      'update': ('updated', 'valid', 'unlicensed')}
 
     ruler = '-'
     about = f"""
@@ -68,6 +97,8 @@ on terms that prohibit them from making any copies of your copyrighted material
 relationship with you.\n
 """
     intro = 'Welcome to ilt v2.\nType "help" to list commands.\n'
+    errors = 0
+    _progress_width = 0
     nohelp = '[ERROR] There is no help on %s.'
     prompt = '> '
 
@@ -93,6 +124,8 @@ relationship with you.\n
         :param message_type: Message type.
 
         """
+        self.errors += 1
+
         match message_type:
             case self._MessageType.UNKNOWN_SYNTAX:
                 self.stdout.write(f'[ERROR] Unknown syntax: {message}\n')
@@ -120,6 +153,20 @@ relationship with you.\n
 
         return
 
+    def onecmd(self, line: str) -> bool:
+        """
+        Runs the command of an input line, unless its double quotes are unbalanced (or do not enclose a whole
+        parameter or the value of a key), which would split a path into several parameters.
+        :param line: Input line.
+        :return: True if the shell must stop.
+
+        """
+        if any(not quoted and '"' in token for token, quoted in self._get_tokens(line)):
+            self.default('Unbalanced double quotes.', self._MessageType.ERROR)
+            return False
+
+        return super().onecmd(line)
+
     def help_help(self) -> None:
         """
         Displays help to "help" command.
@@ -155,46 +202,26 @@ relationship with you.\n
         """
         params, keys = self._get_params_(args), self._get_keys(args)
         allowed_keys = self._IGNORE_DIRS_KEY, self._IGNORE_EXTS_KEY, \
-            self._NO_FILES_LIST_KEY, self._NO_UNKNOWN_EXTS_LIST_KEY
+            self._NO_FILES_LIST_KEY, self._NO_UNKNOWN_EXTS_LIST_KEY, self._WORKERS_KEY, self._PROCESSES_KEY, \
+            self._MANIFEST_KEY, self._GITIGNORE_KEY, self._GIT_KEY, self._SINCE_KEY, self._JOURNAL_KEY, \
+            self._OUTPUT_KEY, self._SHARD_KEY, self._REPORT_KEY, self._COMMENTS_KEY, self._DURABLE_KEY, \
+            self._PROGRESS_KEY, self._CHECKPOINT_KEY
 
-        if any(key not in allowed_keys for key in keys):
+        if any(self._get_key_name(key) not in allowed_keys for key in keys):
             self.default('Incorrect keys.', self._MessageType.ERROR)
 
-        license_name, path, year, copyright_owner, special_line = '', '', '', '', ''
-        ignored_exts = None
-        ignored_dirs = None
+        workers = self._get_workers(keys)
 
-        match len(params):
-            case 5:  # No ignored extensions/directories.
-                license_name = params[0]
-                path = params[1]
-                year = params[2]
-                copyright_owner = params[3]
-                special_line = params[4]
-            case 6:  # Ignored extensions or directories exist (one thing).
-                license_name = params[0]
-                path = params[1]
-                year = params[2]
-                copyright_owner = params[3]
-                special_line = params[4]
-                if self._IGNORE_DIRS_KEY in keys and len(params) == 6:
-                    ignored_dirs = self._get_ignored_dirs(params[5])
-                elif self._IGNORE_EXTS_KEY in keys and len(params) == 6:
-                    ignored_exts = self._get_ignored_exts(params[5])
-            case 7:  # Ignored extensions and directories exist (both).
-                license_name = params[0]
-                path = params[1]
-                year = params[2]
-                copyright_owner = params[3]
-                special_line = params[4]
-                ignored_dirs = self._get_ignored_dirs(params[5])
-                ignored_exts = self._get_ignored_exts(params[6])
-            case value if value < 6:
-                self.default('Too few parameters.', self._MessageType.ERROR)
-                return
-            case value if value > 7:
-                self.default('Too many parameters.', self._MessageType.ERROR)
-                return
+        if workers is None:
+            self.default('Incorrect number of workers.', self._MessageType.ERROR)
+            return
+
+        auto_params = self._get_auto_params(params, keys)
+
+        if auto_params is None:
+            return
+
+        license_name, path, year, copyright_owner, special_line, ignored_dirs, ignored_exts = auto_params
 
         try:
             license_text = lib.get_license_text(license_name, year, copyright_owner, special_line)
@@ -202,27 +229,87 @@ relationship with you.\n
             self.default(exception.message, self._MessageType.ERROR)
             return
 
-        try:
-            success, unknown_exts = lib.auto_insert(license_text, path, ignored_exts, ignored_dirs)
+        manifest = self._get_key_value(keys, self._MANIFEST_KEY)
 
-            if len(success) > 0:
-                self.result('ilt has done inserting license texts.', self._MessageType.SUCCESS)
+        if manifest == '':
+            manifest = join(path, lib.MANIFEST_NAME)
 
-                if self._NO_FILES_LIST_KEY not in keys:
-                    self.result('List of formatted files: ', self._MessageType.NO_JAW)
-                    self._display_items(success)
-            else:
-                self.result('ilt could not find any matching files.', self._MessageType.WARNING)
+        journal = self._get_key_value(keys, self._JOURNAL_KEY)
+
+        if journal == '':
+            journal = join(path, lib.JOURNAL_NAME)
+
+        run_journal = self._get_run_journal(keys, path)
+        checkpoint = self._get_key_value(keys, self._CHECKPOINT_KEY)
+
+        if checkpoint == '':
+            checkpoint = join(path, lib.CHECKPOINT_NAME)
 
-            if self._NO_UNKNOWN_EXTS_LIST_KEY not in keys and len(unknown_exts) > 0:
-                self.result('ilt encountered unknown extensions.', self._MessageType.WARNING)
-                self.result('List of unknown extensions: ', self._MessageType.NO_JAW)
-                self._display_items(unknown_exts)
+        since, output, shard = self._get_since(keys), self._get_output(keys), self._get_shard(keys)
 
+        if since == '' or output == '' or shard == () or not self._load_comment_styles(keys):
             return
-        except FileException as exception:
+
+        # The results are displayed as they come, and the lists of files are only kept for the report.
+        counts, lists, non_text, unknown_exts = {}, {}, [], {}
+        keep_lists = self._get_key_value(keys, self._REPORT_KEY) is not None
+        progress = {} if self._PROGRESS_KEY in keys else None
+        start = last = perf_counter()
+        interrupted = False
+
+        try:
+            results = lib.iter_auto_insert(license_text, path, ignored_exts, ignored_dirs, workers,
+                                           self._PROCESSES_KEY in keys, manifest, self._GITIGNORE_KEY in keys,
+                                           self._GIT_KEY in keys, since, journal, output, shard, unknown_exts,
+                                           run_journal, checkpoint, progress)
+
+            try:
+                for file, status in results:
+                    counts[status] = counts.get(status, 0) + 1
+
+                    if status == lib.INSERTED and self._NO_FILES_LIST_KEY not in keys:
+                        if progress is not None:
+                            self._clear_progress()
+
+                        if counts[status] == 1:
+                            self.result('List of formatted files: ', self._MessageType.NO_JAW)
+
+                        self.stdout.write(file + '\n')
+                    elif status in (lib.BINARY, lib.GENERATED):
+                        non_text.append((file, status))
+
+                    if keep_lists:
+                        lists.setdefault(status, []).append(file)
+
+                    if progress is not None and perf_counter() - last >= self._PROGRESS_INTERVAL:
+                        last = perf_counter()
+                        self._display_progress(progress, last - start)
+            except KeyboardInterrupt:
+                # Closing the generator finishes the files in progress and saves the manifest and the checkpoint.
+                interrupted = True
+                results.close()
+        except (FileException, GitException) as exception:
             self.default(exception.message, self._MessageType.ERROR)
             return
+        finally:
+            if progress is not None:
+                self._clear_progress()
+
+        self._display_auto_summary(counts.get(lib.INSERTED, 0), counts.get(lib.SKIPPED, 0), non_text, unknown_exts,
+                                   keys)
+
+        if progress is not None and progress.get('files', 0) > 0:
+            self._display_progress(progress, perf_counter() - start, True)
+
+        if interrupted:
+            self.default(f'ilt was interrupted after {sum(counts.values())} file(s). '
+                         + (f'Run the same command to continue from the checkpoint ("{checkpoint}").'
+                            if checkpoint is not None else 'Use the "--checkpoint" key to be able to continue.'),
+                         self._MessageType.ERROR)
+            return
+
+        self._save_report(keys, 'auto', (lists.get(lib.INSERTED, []), lists.get(lib.SKIPPED, []), non_text,
+                                         unknown_exts), shard)
 
     def help_auto(self) -> None:
         """
@@ -230,7 +317,9 @@ relationship with you.\n
 
         """
         self.stdout.write('''*** Summary:
-    Automatically inserts the license text into files in the specified root folder.
+    Automatically inserts the license text into files in the specified root folder. The comment format is chosen by
+    the file name, the extension or, for files without an extension, the interpreter in the shebang line (after which
+    the license text is inserted).
 *** Format: 
     auto <license_name> "<path>" <year> "<copyright_holder>" "<special_line>" "<ignored_dirs>" "<ignored_exts>" <keys>
 *** Parameters:
@@ -243,18 +332,110 @@ relationship with you.\n
     <special_line>: special line to be inserted into the license text. Enter empty quotes ("") if you don't need it;
     <ignored_dirs> (optionally, enter the "-d" key): list of directories files in that will not be formatted - 
     must be in double quotes. Ignores the subdirectories too. Each directory name must be separated by a space.
+    Gitignore-style patterns are accepted too (e.g. "**/gen/**", "*.min.js", "!keep.min.js").
     <ignored_exts> (optionally, enter the "-e" key): list of file extensions that will not be formatted - 
     must be in double quotes. Each extension must be separated by a space.
-*** Keys:
+*** Keys (a path with spaces must be in double quotes after "=", e.g. -m="C:\\My Code\\manifest"):
     -d: enable directories ignoring;
+    -i: also ignore the files matched by the ".gitignore" files in the tree;
     -e: enable extensions ignoring;
     -u: will not list unknown extensions at the end;
-    -f: will not list formatted files at the end.
+    -f: will not list formatted files at the end;
+    -w=<count>: insert in parallel with the specified number of workers (all CPU cores if the count is omitted);
+    -p: use processes instead of threads for the parallel workers;
+    -m=<path>: skip files that have not changed since the previous run recorded in the specified manifest file
+    (".ilt-manifest" in the root folder if the path is omitted);
+    -g: format only the files tracked by git instead of walking the whole root folder;
+    --since=<revision>: format only the files that git reports as added or modified since the revision;
+    -j=<path>: record the inserted license texts in the specified undo journal (".ilt-journal" in the root folder
+    if the path is omitted), so that the run can be reverted with the "undo" command;
+    -o=<path>: leave the files untouched and write the licensed copies into the specified output folder, into
+    which the other files are hardlinked (or copied) as they are;
+    --shard=<index>/<count>: process only the shard of the files with the specified 1-based index (the files are
+    split into the shards by a stable hash of their relative paths, so the runs of all shards are disjoint);
+    --report=<path>: save the results to the specified JSON report (see the "merge" command);
+    --comments=<path>: load the comment styles of more file extensions, file names and shebang interpreters from
+    the specified file (in the format of the "COMMENT_STYLES" file of ilt);
+    --durable=<path>: write the licensed files into staged copies and commit them in batches that are flushed to
+    the disk, recording the committed batches in the specified run journal (".ilt-run" in the root folder if the
+    path is omitted), so that a crash never leaves a half-licensed tree;
+    --progress: display the number of the processed files, the speed and the remaining time while inserting (the
+    files are counted by a first walk of the tree);
+    --checkpoint=<path>: record the finished files in the specified checkpoint (".ilt-checkpoint" in the root
+    folder if the path is omitted), so that the same command continues an interrupted (e.g. with Ctrl+C) run
+    instead of starting over. The checkpoint is deleted when the run is finished.
 *** Example:
     * without ignored directories and files (with "-c" and "-s" keys):
         auto lgpl "C:\\Code" 2023 "imlystyi" "ilt - insert license text!" -c -s
     * with ignored directories and files (with "-d" and "-e" keys and ignored directories and extensions):
-        auto lgpl "C:\\Code" 2023 "imlystyi" "ilt - insert license text!" ".idea tsProj" ".js .c .cpp" -d -e\n''')
+        auto lgpl "C:\\Code" 2023 "imlystyi" "ilt - insert license text!" ".idea tsProj" ".js .c .cpp" -d -e
+    * in parallel with 8 worker threads:
+        auto lgpl "C:\\Code" 2023 "imlystyi" "ilt - insert license text!" -w=8
+    * only the files changed since the "main" branch:
+        auto lgpl "C:\\Code" 2023 "imlystyi" "ilt - insert license text!" --since=main\n''')
+
+    def do_check(self, args: str) -> None:
+        """
+        Command that checks (without writing anything) that the files start with the license text.
+
+        """
+        params, keys = self._get_params_(args), self._get_keys(args)
+        allowed_keys = self._IGNORE_DIRS_KEY, self._IGNORE_EXTS_KEY, self._NO_FILES_LIST_KEY, self._WORKERS_KEY, \
+            self._PROCESSES_KEY, self._GITIGNORE_KEY, self._GIT_KEY, self._SINCE_KEY, self._SHARD_KEY, \
+            self._REPORT_KEY, self._COMMENTS_KEY
+
+        if any(self._get_key_name(key) not in allowed_keys for key in keys):
+            self.default('Incorrect keys.', self._MessageType.ERROR)
+
+        workers = self._get_workers(keys)
+
+        if workers is None:
+            self.default('Incorrect number of workers.', self._MessageType.ERROR)
+            return
+
+        auto_params = self._get_auto_params(params, keys)
+
+        if auto_params is None:
+            return
+
+        license_name, path, year, copyright_owner, special_line, ignored_dirs, ignored_exts = auto_params
+        since, shard = self._get_since(keys), self._get_shard(keys)
+
+        if since == '' or shard == () or not self._load_comment_styles(keys):
+            return
+
+        try:
+            results = lib.check_headers(license_name, path, year, copyright_owner, special_line, ignored_exts,
+                                        ignored_dirs, workers, self._PROCESSES_KEY in keys,
+                                        use_gitignore=self._GITIGNORE_KEY in keys, git=self._GIT_KEY in keys,
+                                        since=since, shard=shard)
+        except (FileException, GitException, LicenseNameException) as exception:
+            self.default(exception.message, self._MessageType.ERROR)
+            return
+
+        self._display_check_results(*results, keys)
+        self._save_report(keys, 'check', results, shard)
+
+    def help_check(self) -> None:
+        """
+        Displays help to "check" command.
+
+        """
+        self.stdout.write('''*** Summary:
+    Checks (without writing anything) that the files in the specified root folder start with the license text.
+    Reports an error (and the exit code 1 in the non-interactive mode) if any file has no license text, another
+    header or the license text with other parameters (e.g. an old year). Binary and generated files are not checked,
+    they are listed with a warning.
+*** Format: 
+    check <license_name> "<path>" <year> "<copyright_holder>" "<special_line>" "<ignored_dirs>" "<ignored_exts>" <keys>
+*** Parameters:
+    The same as in the "auto" command.
+*** Keys:
+    -d, -e, -i, -g, --since=<revision>, -w=<count>, -p, --shard=<index>/<count>, --report=<path>,
+    --comments=<path>: the same as in the "auto" command;
+    -f: will not list the files with problems.
+*** Example:
+    check lgpl "C:\\Code" 2023 "imlystyi" "ilt - insert license text!" -w\n''')
 
     def do_exit(self, args: str) -> None:
         """
@@ -302,6 +483,71 @@ relationship with you.\n
         """
         self.stdout.write('Displays a list of all available licenses on the screen.\n')
 
+    def do_merge(self, args: str) -> None:
+        """
+        Command that merges the result reports of the shards of one run.
+
+        """
+        params, keys = self._get_params_(args), self._get_keys(args)
+        allowed_keys = self._NO_FILES_LIST_KEY, self._NO_UNKNOWN_EXTS_LIST_KEY, self._REPORT_KEY
+
+        if any(self._get_key_name(key) not in allowed_keys for key in keys):
+            self.default('Incorrect keys.', self._MessageType.ERROR)
+
+        if len(params) < 1:
+            self.default('Too few parameters.', self._MessageType.ERROR)
+            return
+
+        try:
+            command, results, missing = lib.merge_reports(list(params))
+        except FileException as exception:
+            self.default(exception.message, self._MessageType.ERROR)
+            return
+
+        if command not in self._REPORT_FIELDS:
+            self.default(f'Unknown command of the reports: {command}.', self._MessageType.ERROR)
+            return
+
+        merged = tuple(results.get(field, []) for field in self._REPORT_FIELDS[command])
+        self.result(f'ilt has merged {len(params)} report(s) of the "{command}" command.', self._MessageType.SUCCESS)
+
+        match command:
+            case 'auto':
+                self._display_auto_results(*merged, keys)
+            case 'check':
+                self._display_check_results(*merged, keys)
+            case 'special':
+                self._display_special_results(*merged, keys)
+            case 'update':
+                self._display_update_results(*merged, keys)
+
+        if len(missing) > 0:
+            self.default(f'The reports of the shard(s) {", ".join(map(str, missing))} are missing.',
+                         self._MessageType.ERROR)
+
+        self._save_report(keys, command, merged, None)
+
+    def help_merge(self) -> None:
+        """
+        Displays help to "merge" command.
+
+        """
+        self.stdout.write('''*** Summary:
+    Merges the result reports (see the "--report" key) of the shards of one "auto", "check", "special ext" or
+    "update" run (see the "--shard" key) and displays them as the results of one run.
+*** Format: 
+    merge "<path>" ["<path>" ...] <keys>
+*** Parameters:
+    <path>: path to a report of a shard - must be in double quotes.
+*** Keys:
+    -f: will not list files at the end;
+    -u: will not list unknown extensions at the end;
+    --report=<path>: save the merged report to the specified file.
+*** Example:
+    auto lgpl "C:\\Code" 2023 "imlystyi" "ilt - insert license text!" --shard=1/2 --report=C:\\1.json
+    auto lgpl "C:\\Code" 2023 "imlystyi" "ilt - insert license text!" --shard=2/2 --report=C:\\2.json
+    merge "C:\\1.json" "C:\\2.json"\n''')
+
     def do_special(self, args: str) -> None:
         """
         Command that allows you to do special license text inserting.
@@ -309,11 +555,19 @@ relationship with you.\n
         """
         params, keys = self._get_params_(args), self._get_keys(args)
         allowed_mods = self._SPECIAL_EXTS_MODE, self._SPECIAL_FILE_MODE
-        allowed_keys = self._IGNORE_DIRS_KEY, self._NO_FILES_LIST_KEY
+        allowed_keys = self._IGNORE_DIRS_KEY, self._NO_FILES_LIST_KEY, self._WORKERS_KEY, self._PROCESSES_KEY, \
+            self._GITIGNORE_KEY, self._JOURNAL_KEY, self._OUTPUT_KEY, self._SHARD_KEY, self._REPORT_KEY, \
+            self._DURABLE_KEY
 
-        if any(key not in allowed_keys for key in keys):
+        if any(self._get_key_name(key) not in allowed_keys for key in keys):
             self.default('Incorrect keys.', self._MessageType.ERROR)
 
+        workers = self._get_workers(keys)
+
+        if workers is None:
+            self.default('Incorrect number of workers.', self._MessageType.ERROR)
+            return
+
         license_name, path, ext, comment, year, copyright_owner, special_line = '', '', '', '', '', '', ''
         ignored_dirs = None
 
@@ -339,8 +593,15 @@ relationship with you.\n
                     copyright_owner = params[6]
                     special_line = params[7]
 
-                    if self._IGNORE_DIRS_KEY in keys and len(params) > 9:
+                    if self._IGNORE_DIRS_KEY in keys and len(params) == 9:
                         ignored_dirs = self._get_ignored_dirs(params[8])
+
+                    ext = self._get_special_exts(ext, comment)
+
+                    if ext is None:
+                        self.default('The number of the comment formats must be 1 or the number of the extensions.',
+                                     self._MessageType.ERROR)
+                        return
             case self._SPECIAL_FILE_MODE:
                 if len(params) < 7:
                     self.default('Too few parameters.', self._MessageType.ERROR)
@@ -359,46 +620,57 @@ relationship with you.\n
             self.default(exception.message, self._MessageType.ERROR)
             return
 
+        journal = self._get_key_value(keys, self._JOURNAL_KEY)
+
+        if journal == '':
+            journal = join(dirname(path) if mode == self._SPECIAL_FILE_MODE else path, lib.JOURNAL_NAME)
+
+        output, shard = self._get_output(keys), self._get_shard(keys)
+
+        if output == '' or shard == ():
+            return
+        elif mode == self._SPECIAL_FILE_MODE and any(key is not None for key in (output, shard)):
+            self.default('The "-o" and "--shard" keys are only allowed in the "ext" mode.', self._MessageType.ERROR)
+            return
+
         try:
             if mode == self._SPECIAL_FILE_MODE:
-                _ = lib.special_file_insert(license_text, path, comment)
+                _ = lib.special_file_insert(license_text, path, comment, journal=journal,
+                                            durable=self._get_key_value(keys, self._DURABLE_KEY) is not None)
                 self.result('ilt has done inserting license text.', self._MessageType.SUCCESS)
                 return
             else:
-                success = lib.special_ext_insert(license_text, path, ext, comment, ignored_dirs)
-
-                if len(success) > 0:
-                    self.result('ilt has done inserting license text.', self._MessageType.SUCCESS)
-
-                    if self._NO_FILES_LIST_KEY not in keys:
-                        self.result('List of formatted files: ', self._MessageType.NO_JAW)
-                        self._display_items(success)
-                else:
-                    self.result('ilt could not find files with the specified extension.', self._MessageType.WARNING)
-
-                return
+                results = lib.special_ext_insert(license_text, path, ext, comment, ignored_dirs, workers,
+                                                 self._PROCESSES_KEY in keys, self._GITIGNORE_KEY in keys, journal,
+                                                 output, shard, self._get_run_journal(keys, path))
         except FileException as exception:
             self.default(exception.message, self._MessageType.ERROR)
             return
 
+        self._display_special_results(*results, keys)
+        self._save_report(keys, 'special', results, shard)
+
     def help_special(self) -> None:
         """
         Displays help to "special" command.
 
         """
         self.stdout.write('''*** Summary:
-    Inserts the license text into the specified file or files with the specified extension.
+    Inserts the license text into the specified file or files with the specified extensions (all of which are
+    processed in one walk of the tree).
 *** Format: 
     * inserting into a specified file:
         special file <license_name> "<path>" "<comments_format>" <year> "<copyright_holder>" "<special_line>"
-    * inserting into the files with the specified extension:
+    * inserting into the files with the specified extensions:
         special ext <license_name> "<path>" "<ext>" "<comments_format>" <year> "<copyright_holder>" "<special_line>" 
         "<ignored_folders>"
 *** Parameters:
     <license_name>: license name - must be without quotes. Enter "licenses" to display all licenses;
     <path>: path to the root folder or to the specified file - must be in double quotes;
-    <ext>: specified file extension - must be in double quotes;
-    <comments_format>: comment format in this file or files with the specified extension - must be in double quotes;
+    <ext>: specified file extension - must be in double quotes. Each extension must be separated by a space;
+    <comments_format>: comment format in this file or files with the specified extensions - must be in double quotes.
+    Either one format for all the extensions or one format per extension, each separated by "|". A block comment
+    is entered as its start and end ("<!-- -->") or its start, line prefix and end ("/* * */");
     <year>: year to be inserted in the license text - must be without quotes. Enter 0 if you don't 
     need it;
     <copyright_holder>: copyright holder name to be inserted into the license text. - must be double-quoted. Enter empty 
@@ -406,34 +678,594 @@ relationship with you.\n
     <special_line>: special line to be inserted into the license text. Enter empty quotes ("") if you don't need it.
     <ignored_dirs> (optionally, enter the "-d" key): list of directories files in that will not be formatted - 
     must be in double quotes. Ignores the subdirectories too. Each directory name must be separated by a space.
-*** Keys:
+    Gitignore-style patterns are accepted too (e.g. "**/gen/**", "*.min.js", "!keep.min.js").
+*** Keys (a path with spaces must be in double quotes after "=", e.g. -m="C:\\My Code\\manifest"):
     -d: enable directories ignoring;
+    -i: also ignore the files matched by the ".gitignore" files in the tree;
     -f: will not list formatted files at the end;
-    -u: will not list unknown extensions at the end.    
+    -u: will not list unknown extensions at the end;
+    -w=<count>: insert in parallel with the specified number of workers (all CPU cores if the count is omitted);
+    -p: use processes instead of threads for the parallel workers;
+    -j=<path>: record the inserted license texts in the specified undo journal (".ilt-journal" in the root folder,
+    or in the folder of the specified file, if the path is omitted);
+    -o=<path>: write the licensed copies into the specified output folder (only in the "ext" mode, as in "auto");
+    --shard=<index>/<count>: process only the specified shard of the files (only in the "ext" mode, as in "auto");
+    --report=<path>: save the results to the specified JSON report (see the "merge" command);
+    --durable=<path>: commit the licensed files durably with the specified run journal (as in "auto"); in the "file"
+    mode, the file is flushed to the disk and no run journal is written.
 *** Example:
     * inserting into a specified file:
         special file lgpl "C:\\Code\\code.py" "#" 2023 "imlystyi" "ilt - insert license text!"
     * inserting into the files with the specified extension (without keys):
         special ext lgpl "C:\\Code" ".py" "#" 2023 "imlystyi" "ilt - insert license text!"
     * inserting into the files with the specified extension (with "-d" key and ignored directories):
-        special ext lgpl "C:\\Code" ".py" "#" 2023 "imlystyi" "ilt - insert license text!" ".idea tsProj" -d\n''')
+        special ext lgpl "C:\\Code" ".py" "#" 2023 "imlystyi" "ilt - insert license text!" ".idea tsProj" -d
+    * inserting into the files with several extensions and comment formats in one walk:
+        special ext lgpl "C:\\Code" ".foo .bar" "# | /* * */" 2023 "imlystyi" "ilt - insert license text!"\n''')
+
+    def do_stats(self, args: str) -> None:
+        """
+        Command that controls and displays the statistics of the stages of the license text inserting.
+
+        """
+        params, keys = self._get_params_(args), self._get_keys(args)
+
+        if len(keys) > 0:
+            self.default('This command has no keys.', self._MessageType.ERROR)
+            return
+
+        mode = params[0] if len(params) > 0 else ''
+
+        if len(params) > (2 if mode == self._STATS_JSON_MODE else 1):
+            self.default('Too many parameters.', self._MessageType.ERROR)
+            return
+
+        match mode:
+            case self._STATS_ON_MODE:
+                stats.enable()
+                self.result('ilt has enabled statistics collection.', self._MessageType.SUCCESS)
+            case self._STATS_OFF_MODE:
+                stats.disable()
+                self.result('ilt has disabled statistics collection.', self._MessageType.SUCCESS)
+            case self._STATS_RESET_MODE:
+                stats.reset()
+                self.result('ilt has reset the statistics.', self._MessageType.SUCCESS)
+            case '' | self._STATS_JSON_MODE:
+                import json
+
+                if stats.collector is None:
+                    self.result('Statistics collection is disabled, enable it with "stats on".',
+                                self._MessageType.WARNING)
+                elif mode == '':
+                    self.result(stats.collector.format(), self._MessageType.NO_JAW)
+                elif len(params) == 1:
+                    self.result(json.dumps(stats.collector.to_dict(), indent=2), self._MessageType.NO_JAW)
+                else:
+                    try:
+                        with open(params[1], 'w', encoding='utf-8') as file:
+                            json.dump(stats.collector.to_dict(), file, indent=2)
+                    except (OSError, IOError):
+                        self.default(f'Failed file access: {params[1]} (OSError/IOError).', self._MessageType.ERROR)
+                        return
+
+                    self.result('ilt has saved the statistics.', self._MessageType.SUCCESS)
+            case _:
+                self.default('Incorrect mode.', self._MessageType.ERROR)
+
+    def help_stats(self) -> None:
+        """
+        Displays help to "stats" command.
+
+        """
+        self.stdout.write('''*** Summary:
+    Controls and displays the counters (files, bytes read/written, skips, errors) and the timings of the stages
+    (discovery, template, read, render, write) of the license text inserting.
+*** Format: 
+    stats [<mode>] ["<path>"]
+*** Parameters:
+    <mode>: "on" to enable the collection, "off" to disable it, "reset" to drop the collected statistics,
+    "json" to display them (or save them to the specified file) as JSON. Displays the statistics if omitted;
+    <path>: path to the JSON file (only in the "json" mode) - must be in double quotes.
+*** Example:
+    stats on
+    auto lgpl "C:\\Code" 2023 "imlystyi" "ilt - insert license text!"
+    stats
+    stats json "C:\\Code\\stats.json"\n''')
+
+    def do_undo(self, args: str) -> None:
+        """
+        Command that strips the license texts recorded in the undo journal out of the files.
+
+        """
+        params, keys = self._get_params_(args), self._get_keys(args)
+        allowed_keys = self._NO_FILES_LIST_KEY, self._WORKERS_KEY, self._PROCESSES_KEY
+
+        if any(self._get_key_name(key) not in allowed_keys for key in keys):
+            self.default('Incorrect keys.', self._MessageType.ERROR)
+
+        workers = self._get_workers(keys)
+
+        if workers is None:
+            self.default('Incorrect number of workers.', self._MessageType.ERROR)
+            return
+
+        if len(params) < 1:
+            self.default('Too few parameters.', self._MessageType.ERROR)
+            return
+        elif len(params) > 1:
+            self.default('Too many parameters.', self._MessageType.ERROR)
+            return
+
+        try:
+            restored, failed = lib.undo_journal(params[0], workers, self._PROCESSES_KEY in keys)
+        except FileException as exception:
+            self.default(exception.message, self._MessageType.ERROR)
+            return
+
+        if len(restored) > 0:
+            self.result(f'ilt has stripped the license text out of {len(restored)} file(s).',
+                        self._MessageType.SUCCESS)
+
+            if self._NO_FILES_LIST_KEY not in keys:
+                self.result('List of restored files: ', self._MessageType.NO_JAW)
+                self._display_items(restored)
+        elif len(failed) == 0:
+            self.result('The undo journal is empty.', self._MessageType.WARNING)
+
+        if len(failed) > 0:
+            self.default(f'ilt could not restore {len(failed)} file(s) that have changed since the insertion '
+                         f'(the journal is kept).', self._MessageType.ERROR)
+            self.result('List of files that could not be restored: ', self._MessageType.NO_JAW)
+            self._display_items(failed)
+
+    def help_undo(self) -> None:
+        """
+        Displays help to "undo" command.
+
+        """
+        self.stdout.write('''*** Summary:
+    Strips the license texts recorded in the specified undo journal (see the "-j" key of the "auto" and "special"
+    commands) out of the files, latest first. A file is only restored if it still starts with the recorded license
+    text. The journal is deleted when all the files are restored.
+*** Format: 
+    undo "<path>" <keys>
+*** Parameters:
+    <path>: path to the undo journal - must be in double quotes.
+*** Keys:
+    -f: will not list restored files at the end;
+    -w=<count>: restore in parallel with the specified number of workers (all CPU cores if the count is omitted);
+    -p: use processes instead of threads for the parallel workers.
+*** Example:
+    auto lgpl "C:\\Code" 2023 "imlystyi" "ilt - insert license text!" -j
+    undo "C:\\Code\\.ilt-journal" -w\n''')
+
+    def do_update(self, args: str) -> None:
+        """
+        Command that replaces the outdated license texts of the files with the license text with new parameters.
+
+        """
+        params, keys = self._get_params_(args), self._get_keys(args)
+        allowed_keys = self._IGNORE_DIRS_KEY, self._IGNORE_EXTS_KEY, self._NO_FILES_LIST_KEY, self._WORKERS_KEY, \
+            self._PROCESSES_KEY, self._GITIGNORE_KEY, self._GIT_KEY, self._SINCE_KEY, self._SHARD_KEY, \
+            self._REPORT_KEY, self._COMMENTS_KEY
+
+        if any(self._get_key_name(key) not in allowed_keys for key in keys):
+            self.default('Incorrect keys.', self._MessageType.ERROR)
+
+        workers = self._get_workers(keys)
+
+        if workers is None:
+            self.default('Incorrect number of workers.', self._MessageType.ERROR)
+            return
+
+        auto_params = self._get_auto_params(params, keys)
+
+        if auto_params is None:
+            return
+
+        license_name, path, year, copyright_owner, special_line, ignored_dirs, ignored_exts = auto_params
+        since, shard = self._get_since(keys), self._get_shard(keys)
+
+        if since == '' or shard == () or not self._load_comment_styles(keys):
+            return
+
+        try:
+            results = lib.update_headers(license_name, path, year, copyright_owner, special_line, ignored_exts,
+                                         ignored_dirs, workers, self._PROCESSES_KEY in keys,
+                                         use_gitignore=self._GITIGNORE_KEY in keys, git=self._GIT_KEY in keys,
+                                         since=since, shard=shard)
+        except (FileException, GitException, LicenseNameException) as exception:
+            self.default(exception.message, self._MessageType.ERROR)
+            return
+
+        self._display_update_results(*results, keys)
+        self._save_report(keys, 'update', results, shard)
+
+    def help_update(self) -> None:
+        """
+        Displays help to "update" command.
+
+        """
+        self.stdout.write('''*** Summary:
+    Replaces the license texts inserted with other parameters (e.g. an old year or copyright holder) with the
+    license text with the specified parameters. If the new license text has the same length, only it is rewritten.
+*** Format: 
+    update <license_name> "<path>" <year> "<copyright_holder>" "<special_line>" "<ignored_dirs>" "<ignored_exts>" <keys>
+*** Parameters:
+    The same as in the "auto" command (<year>, <copyright_holder> and <special_line> are the new parameters).
+*** Keys:
+    -d, -e, -i, -g, --since=<revision>, -w=<count>, -p, --shard=<index>/<count>, --report=<path>,
+    --comments=<path>: the same as in the "auto" command;
+    -f: will not list the updated files and the files without the license text.
+*** Example:
+    update lgpl "C:\\Code" 2024 "imlystyi" "ilt - insert license text!" -w\n''')
+
+    def do_watch(self, args: str) -> None:
+        """
+        Command that inserts the license text into the new files in the root folder as they appear.
+
+        """
+        params, keys = self._get_params_(args), self._get_keys(args)
+        allowed_keys = self._IGNORE_DIRS_KEY, self._IGNORE_EXTS_KEY, self._NO_FILES_LIST_KEY, self._POLL_KEY, \
+            self._DEBOUNCE_KEY, self._COMMENTS_KEY
+
+        if any(self._get_key_name(key) not in allowed_keys for key in keys):
+            self.default('Incorrect keys.', self._MessageType.ERROR)
+
+        auto_params = self._get_auto_params(params, keys)
+
+        if auto_params is None:
+            return
+
+        license_name, path, year, copyright_owner, special_line, ignored_dirs, ignored_exts = auto_params
+        debounce, interval = self._get_seconds(keys, self._DEBOUNCE_KEY, 0.5), self._get_seconds(keys, self._POLL_KEY)
+
+        if debounce is None or interval is None:
+            self.default('Incorrect number of seconds.', self._MessageType.ERROR)
+            return
+
+        if not self._load_comment_styles(keys):
+            return
+
+        try:
+            license_text = lib.get_license_text(license_name, year, copyright_owner, special_line)
+            results = lib.watch_insert(license_text, path, ignored_exts, ignored_dirs, debounce,
+                                       self._get_key_value(keys, self._POLL_KEY) is not None, interval)
+            counts = {}
+            self.result('ilt is watching for new files (press Ctrl+C to stop).', self._MessageType.NO_JAW)
+
+            try:
+                for file, status in results:
+                    counts[status] = counts.get(status, 0) + 1
+
+                    if status == lib.INSERTED and self._NO_FILES_LIST_KEY not in keys:
+                        self.stdout.write(file + '\n')
+                        self.stdout.flush()
+            except KeyboardInterrupt:
+                results.close()
+        except (FileException, LicenseNameException) as exception:
+            self.default(exception.message, self._MessageType.ERROR)
+            return
+
+        self.result(f'ilt has inserted license texts into {counts.get(lib.INSERTED, 0)} new file(s).',
+                    self._MessageType.SUCCESS)
+        self._display_skipped(counts.get(lib.SKIPPED, 0))
+
+        if counts.get(lib.BINARY, 0) + counts.get(lib.GENERATED, 0) > 0:
+            self.result(f'ilt skipped {counts.get(lib.BINARY, 0) + counts.get(lib.GENERATED, 0)} binary or '
+                        f'generated file(s).', self._MessageType.WARNING)
+
+    def help_watch(self) -> None:
+        """
+        Displays help to "watch" command.
+
+        """
+        self.stdout.write('''*** Summary:
+    Watches the specified root folder and inserts the license text into the new files with known extensions as they
+    appear (created, copied or moved in), until Ctrl+C is pressed. Files that already start with the license text,
+    binary and generated files are skipped, and the files that existed before are not touched (use "auto" for them).
+    Bursts of new files (e.g. a checkout) are formatted together once they have stopped changing.
+*** Format: 
+    watch <license_name> "<path>" <year> "<copyright_holder>" "<special_line>" "<ignored_dirs>" "<ignored_exts>" <keys>
+*** Parameters:
+    The same as in the "auto" command.
+*** Keys:
+    -d, -e, --comments=<path>: the same as in the "auto" command;
+    -f: will not list the formatted files as they are formatted;
+    --poll=<seconds>: rescan the tree at the specified interval (1 second if it is omitted) instead of receiving
+    the events of the operating system (which are only available on Linux, elsewhere the tree is always rescanned);
+    --debounce=<seconds>: wait until no file has appeared or changed for the specified time before formatting the
+    new files (0.5 seconds by default).
+*** Example:
+    watch lgpl "C:\\Code" 2023 "imlystyi" "ilt - insert license text!" "venv" -d --poll=2\n''')
+
+    def _display_auto_results(self, success: list, skipped: list, non_text: list, unknown_exts: dict,
+                              keys: list[str]) -> None:
+        if len(success) > 0 and self._NO_FILES_LIST_KEY not in keys:
+            self.result('List of formatted files: ', self._MessageType.NO_JAW)
+            self._display_items(success)
+
+        self._display_auto_summary(len(success), len(skipped), non_text, unknown_exts, keys)
+
+    def _display_auto_summary(self, success: int, skipped: int, non_text: list, unknown_exts: dict,
+                              keys: list[str]) -> None:
+        if success > 0:
+            self.result(f'ilt has done inserting license texts into {success} file(s).', self._MessageType.SUCCESS)
+        elif skipped == 0 and len(non_text) == 0:
+            self.result('ilt could not find any matching files.', self._MessageType.WARNING)
+
+        self._display_skipped(skipped)
+        self._display_non_text(non_text, keys)
+
+        if self._NO_UNKNOWN_EXTS_LIST_KEY not in keys and len(unknown_exts) > 0:
+            self.result(f'ilt encountered {len(unknown_exts)} unknown extension(s).', self._MessageType.WARNING)
+            self.result('List of unknown extensions (with the number of files and samples): ',
+                        self._MessageType.NO_JAW)
+            self._display_items([f'{ext or "(no extension)"}: {count} ({", ".join(files)})' for ext, (count, files)
+                                 in sorted(unknown_exts.items(), key=lambda item: (-item[1][0], item[0]))])
+
+    def _display_progress(self, progress: dict, seconds: float, final: bool = False) -> None:
+        files, total, size = progress.get('files', 0), progress.get('total', 0), progress.get('bytes', 0)
+        speed, size_speed = (files / seconds, size / seconds / 1024 ** 2) if seconds else (0.0, 0.0)
+        line = f'{files}/{total} file(s), {speed:.0f} files/sec, {size_speed:.1f} MB/sec'
+
+        if final:
+            self.result(f'Processed {line} in {seconds:.1f} s.', self._MessageType.NO_JAW)
+            return
+
+        remaining = (total - files) / speed if speed else 0
+        line = f'\r{line}, ETA {int(remaining) // 3600}:{int(remaining) // 60 % 60:02}:{int(remaining) % 60:02}'
+        self.stdout.write(line.ljust(self._progress_width))
+        self.stdout.flush()
+        self._progress_width = len(line)
+
+    def _clear_progress(self) -> None:
+        if self._progress_width > 0:
+            self.stdout.write('\r' + ' ' * self._progress_width + '\r')
+            self._progress_width = 0
+
+    def _display_check_results(self, valid: list, missing: list, mismatched: list, outdated: list, non_text: list,
+                               keys: list[str]) -> None:
+        for files, description in (missing, 'without the license text'), (mismatched, 'with another header'), \
+                (outdated, 'with an outdated license text'):
+            if len(files) > 0 and self._NO_FILES_LIST_KEY not in keys:
+                self.result(f'List of files {description}: ', self._MessageType.NO_JAW)
+                self._display_items(files)
+
+        if len(missing) + len(mismatched) + len(outdated) > 0:
+            self.default(f'ilt found {len(missing)} file(s) without the license text, {len(mismatched)} with another '
+                         f'header and {len(outdated)} with an outdated one ({len(valid)} valid).',
+                         self._MessageType.ERROR)
+        elif len(valid) > 0:
+            self.result(f'All {len(valid)} checked file(s) start with the license text.', self._MessageType.SUCCESS)
+        elif len(non_text) == 0:
+            self.result('ilt could not find any matching files.', self._MessageType.WARNING)
+
+        self._display_non_text(non_text, keys)
 
     def _display_items(self, items: list):
         for item in items:
             self.stdout.write(item + '\n')
 
+    def _display_skipped(self, skipped: int):
+        if skipped > 0:
+            self.result(f'ilt skipped {skipped} file(s) that already start with the license text '
+                        f'or have not changed.', self._MessageType.WARNING)
+
+    def _display_non_text(self, non_text: list, keys: list[str]):
+        if len(non_text) > 0:
+            self.result(f'ilt skipped {len(non_text)} binary or generated file(s).', self._MessageType.WARNING)
+
+            if self._NO_FILES_LIST_KEY not in keys:
+                self.result('List of skipped binary or generated files: ', self._MessageType.NO_JAW)
+                self._display_items([f'{file} ({status})' for file, status in non_text])
+
+    def _display_special_results(self, success: list, skipped: list, non_text: list, keys: list[str]) -> None:
+        if len(success) > 0:
+            self.result('ilt has done inserting license text.', self._MessageType.SUCCESS)
+
+            if self._NO_FILES_LIST_KEY not in keys:
+                self.result('List of formatted files: ', self._MessageType.NO_JAW)
+                self._display_items(success)
+        elif len(skipped) == 0 and len(non_text) == 0:
+            self.result('ilt could not find files with the specified extension.', self._MessageType.WARNING)
+
+        self._display_skipped(len(skipped))
+        self._display_non_text(non_text, keys)
+
+    def _display_update_results(self, updated: list, valid: list, unlicensed: list, keys: list[str]) -> None:
+        if len(updated) > 0:
+            self.result(f'ilt has updated the license text in {len(updated)} file(s).', self._MessageType.SUCCESS)
+
+            if self._NO_FILES_LIST_KEY not in keys:
+                self.result('List of updated files: ', self._MessageType.NO_JAW)
+                self._display_items(updated)
+        else:
+            self.result('ilt could not find any outdated license texts.', self._MessageType.WARNING)
+
+        if len(valid) > 0:
+            self.result(f'{len(valid)} file(s) already start with the license text.', self._MessageType.WARNING)
+
+        if len(unlicensed) > 0:
+            self.result(f'{len(unlicensed)} file(s) do not start with the license text (use "auto" to insert it).',
+                        self._MessageType.WARNING)
+
+            if self._NO_FILES_LIST_KEY not in keys:
+                self.result('List of files without the license text: ', self._MessageType.NO_JAW)
+                self._display_items(unlicensed)
+
+    def _get_auto_params(self, params: tuple, keys: list[str]) -> tuple | None:
+        license_name, path, year, copyright_owner, special_line = '', '', '', '', ''
+        ignored_exts = None
+        ignored_dirs = None
+
+        match len(params):
+            case 5:  # No ignored extensions/directories.
+                license_name = params[0]
+                path = params[1]
+                year = params[2]
+                copyright_owner = params[3]
+                special_line = params[4]
+            case 6:  # Ignored extensions or directories exist (one thing).
+                license_name = params[0]
+                path = params[1]
+                year = params[2]
+                copyright_owner = params[3]
+                special_line = params[4]
+                if self._IGNORE_DIRS_KEY in keys and len(params) == 6:
+                    ignored_dirs = self._get_ignored_dirs(params[5])
+                elif self._IGNORE_EXTS_KEY in keys and len(params) == 6:
+                    ignored_exts = self._get_ignored_exts(params[5])
+            case 7:  # Ignored extensions and directories exist (both).
+                license_name = params[0]
+                path = params[1]
+                year = params[2]
+                copyright_owner = params[3]
+                special_line = params[4]
+                ignored_dirs = self._get_ignored_dirs(params[5])
+                ignored_exts = self._get_ignored_exts(params[6])
+            case value if value < 6:
+                self.default('Too few parameters.', self._MessageType.ERROR)
+                return None
+            case value if value > 7:
+                self.default('Too many parameters.', self._MessageType.ERROR)
+                return None
+
+        return license_name, path, year, copyright_owner, special_line, ignored_dirs, ignored_exts
+
+    def _get_special_exts(self, exts: str, comments: str) -> dict[str, str] | None:
+        # Several extensions are separated by spaces, and their comment formats (if they differ) by "|".
+        exts, comments = exts.split(), [comment.strip() for comment in comments.split('|')]
+
+        if len(comments) == 1:
+            comments *= len(exts)
+        elif len(comments) != len(exts):
+            return None
+
+        return dict(zip(exts, comments))
+
     def _get_ignored_dirs(self, folders: str) -> list[str]:
         return folders.split(' ')
 
     def _get_ignored_exts(self, exts: str) -> list[str]:
         return exts.split(' ')
 
+    def _get_key_name(self, key: str) -> str:
+        return key.split('=', 1)[0]
+
+    def _get_key_value(self, keys: list[str], key_name: str) -> str | None:
+        for key in keys:
+            name, _, value = key.partition('=')
+
+            if name == key_name:
+                return value
+
+        return None
+
     def _get_keys(self, args: str) -> list[str]:
-        return [kk for kk in args.split() if kk[0] == '-']
+        return [token for token, quoted in self._get_tokens(args) if not quoted and token.startswith('-')]
+
+    def _get_output(self, keys: list[str]) -> str | None:
+        output = self._get_key_value(keys, self._OUTPUT_KEY)
+
+        if output == '':
+            self.default('The path of the "-o" key is missing.', self._MessageType.ERROR)
+
+        return output
+
+    def _get_run_journal(self, keys: list[str], path: str) -> str | None:
+        run_journal = self._get_key_value(keys, self._DURABLE_KEY)
+
+        return join(path, lib.RUN_JOURNAL_NAME) if run_journal == '' else run_journal
+
+    def _get_seconds(self, keys: list[str], key_name: str, default: float = 1.0) -> float | None:
+        value = self._get_key_value(keys, key_name)
+
+        if value is None or value == '':
+            return default
+
+        try:
+            seconds = float(value)
+        except ValueError:
+            return None
+
+        return seconds if seconds >= 0 else None
+
+    def _get_shard(self, keys: list[str]) -> tuple[int, int] | None:
+        # Returns an empty tuple (after reporting the error) if the shard is invalid.
+        shard = self._get_key_value(keys, self._SHARD_KEY)
+
+        if shard is None:
+            return None
+
+        index, _, count = shard.partition('/')
+
+        if not index.isdigit() or not count.isdigit() or not 1 <= int(index) <= int(count):
+            self.default('Incorrect shard (must be "--shard=<index>/<count>", e.g. "--shard=1/4").',
+                         self._MessageType.ERROR)
+            return ()
+
+        return int(index), int(count)
+
+    def _get_since(self, keys: list[str]) -> str | None:
+        since = self._get_key_value(keys, self._SINCE_KEY)
+
+        if since == '':
+            self.default('The revision of the "--since" key is missing.', self._MessageType.ERROR)
+
+        return since
+
+    def _load_comment_styles(self, keys: list[str]) -> bool:
+        path = self._get_key_value(keys, self._COMMENTS_KEY)
+
+        if path is None:
+            return True
+        elif path == '':
+            self.default('The path of the "--comments" key is missing.', self._MessageType.ERROR)
+            return False
+
+        try:
+            lib.load_comment_styles(path)
+        except FileException as exception:
+            self.default(exception.message, self._MessageType.ERROR)
+            return False
+
+        return True
+
+    def _save_report(self, keys: list[str], command: str, results: tuple, shard: tuple[int, int] | None) -> None:
+        path = self._get_key_value(keys, self._REPORT_KEY)
+
+        if path is None:
+            return
+        elif path == '':
+            self.default('The path of the "--report" key is missing.', self._MessageType.ERROR)
+            return
+
+        try:
+            lib.save_report(path, command, dict(zip(self._REPORT_FIELDS[command], results)), shard)
+        except FileException as exception:
+            self.default(exception.message, self._MessageType.ERROR)
+
+    def _get_workers(self, keys: list[str]) -> int | None:
+        value = self._get_key_value(keys, self._WORKERS_KEY)
+
+        if value is None:
+            return 1
+        elif value == '':
+            return cpu_count() or 1
+        elif value.isdigit() and int(value) > 0:
+            return int(value)
+        else:
+            return None
 
     def _get_params_(self, args: str) -> tuple:
-        found = findall(r'"([^"]+)"|(\S+)', args)
-        matches = tuple(match[0] or match[1] for match in found)
-        return tuple(match for match in matches if match[0] != '-')
+        return tuple(token for token, quoted in self._get_tokens(args) if quoted or not token.startswith('-'))
+
+    def _get_tokens(self, args: str) -> list[tuple[str, bool]]:
+        # Splits the input by whitespace, except inside double quotes. Each token is paired with whether it was quoted:
+        # a quoted token is always a parameter (it may be empty or contain " - "), and only an unquoted one is a key.
+        # The value of a key may be quoted after "=" (e.g. -m="C:\My Dir\manifest"), and is then a part of the key.
+        return [(key + value, False) if key else (quoted, True) if unquoted == '' else (unquoted, False)
+                for key, value, quoted, unquoted in findall(r'(-[^\s"=]+=)"([^"]*)"|"([^"]*)"|(\S+)', args)]
 
     # endregion
@@ -0,0 +1,164 @@
+# ilt - insert license text
+# Copyright (C) 2023  imlystyi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+A module that collects counters and stage timings of the "ilt" application.
+
+The collection is disabled by default: the hooks in "iltlib" only check that "collector" is None, so they cost almost
+nothing until "enable" is called. Only the work done in the current process is collected, so the stages executed by
+a process pool are not timed.
+
+"""
+# region Fields
+
+STAGES = ('discovery', 'template', 'read', 'render', 'write')
+"""
+Names of the timed stages, in the order in which a file passes through them.
+"""
+
+collector = None
+"""
+Current statistics collector (None if the collection is disabled).
+"""
+
+# endregion
+
+
+# region Classes
+
+class Stats:
+    """
+    Thread-safe collector of counters and timing histograms (with power-of-two microsecond buckets) of the stages.
+    """
+    def __init__(self):
+        from threading import Lock
+
+        self._lock = Lock()
+        self.counters = {}
+        self.timings = {}
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        Increases the counter with the specified name.
+        :param name: Counter name.
+        :param value: Value to be added to the counter.
+
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def time(self, stage: str, seconds: float) -> None:
+        """
+        Adds the duration of the specified stage to its timing histogram.
+        :param stage: Stage name.
+        :param seconds: Duration of the stage in seconds.
+
+        """
+        bucket = int(seconds * 1_000_000).bit_length()
+
+        with self._lock:
+            timing = self.timings.get(stage)
+
+            if timing is None:
+                timing = self.timings[stage] = {'count': 0, 'total': 0.0, 'min': seconds, 'max': seconds,
+                                                'histogram': {}}
+
+            timing['count'] += 1
+            timing['total'] += seconds
+            timing['min'] = min(timing['min'], seconds)
+            timing['max'] = max(timing['max'], seconds)
+            timing['histogram'][bucket] = timing['histogram'].get(bucket, 0) + 1
+
+    def to_dict(self) -> dict:
+        """
+        Converts the collected statistics to a JSON-serializable dictionary.
+        :return: Dictionary of the counters and timings (histogram keys are the exclusive upper bounds of the buckets
+        in microseconds).
+
+        """
+        with self._lock:
+            return {'counters': dict(self.counters),
+                    'timings': {stage: {'count': timing['count'], 'total': timing['total'],
+                                        'min': timing['min'], 'max': timing['max'],
+                                        'histogram': {str(2 ** bucket): count
+                                                      for bucket, count in sorted(timing['histogram'].items())}}
+                                for stage, timing in self._sorted_timings()}}
+
+    def format(self) -> str:
+        """
+        Formats the collected statistics as a human-readable table.
+        :return: Formatted statistics.
+
+        """
+        data = self.to_dict()
+        lines = ['Counters:']
+        lines += [f'    {name}: {value}' for name, value in sorted(data['counters'].items())] or ['    (none)']
+        lines.append('Stages:')
+
+        for stage, timing in data['timings'].items():
+            lines.append(f'    {stage}: {timing["count"]} calls, {timing["total"] * 1000:.3f} ms total, '
+                         f'{timing["total"] / timing["count"] * 1_000_000:.1f} us average, '
+                         f'{timing["max"] * 1_000_000:.1f} us max')
+            lines.append('        ' + ', '.join(f'<{bound}us: {count}' for bound, count in
+                                                timing['histogram'].items()))
+
+        if not data['timings']:
+            lines.append('    (none)')
+
+        return '\n'.join(lines)
+
+    def _sorted_timings(self):
+        return sorted(self.timings.items(),
+                      key=lambda item: STAGES.index(item[0]) if item[0] in STAGES else len(STAGES))
+
+# endregion
+
+
+# region Methods
+
+def enable() -> Stats:
+    """
+    Enables the statistics collection (keeping the already collected statistics).
+    :return: Current statistics collector.
+
+    """
+    global collector
+
+    if collector is None:
+        collector = Stats()
+
+    return collector
+
+
+def disable() -> None:
+    """
+    Disables the statistics collection and drops the collected statistics.
+
+    """
+    global collector
+    collector = None
+
+
+def reset() -> None:
+    """
+    Drops the collected statistics (the collection stays enabled if it was).
+
+    """
+    global collector
+
+    if collector is not None:
+        collector = Stats()
+
+# endregion
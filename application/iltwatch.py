@@ -0,0 +1,303 @@
+# ilt - insert license text
+# Copyright (C) 2023  imlystyi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+A module that watches a folder tree for new files.
+
+On Linux the inotify API (loaded with ctypes) reports the new files as soon as they appear, so a new file costs only
+its own event. Elsewhere, or if inotify is not available, the tree is rescanned at a fixed interval.
+
+"""
+import sys
+from os import scandir
+from os.path import join
+from time import monotonic, sleep, time_ns
+
+# region Fields
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+"""
+Flags of the inotify API (see "inotify(7)").
+"""
+
+_WATCH_MASK = _IN_CREATE | _IN_MOVED_TO | _IN_CLOSE_WRITE
+"""
+Events watched in every folder.
+"""
+
+_READ_SIZE = 64 * 1024
+"""
+Size of the buffer into which the inotify events are read.
+"""
+
+_OVERFLOW_MARGIN = 1_000_000_000
+"""
+Time in nanoseconds before the last drain of the inotify queue, since which the changed files are reported after
+the queue overflows (the change times of the files may lag behind the clock a little).
+"""
+
+# endregion
+
+
+# region Classes
+
+class InotifyWatcher:
+    """
+    Watcher of the new files in a folder tree based on the inotify API of Linux. If the event queue overflows, the
+    tree is rescanned for the files changed since the queue was last drained, which are all reported as new.
+    """
+    def __init__(self, root: str, prune=None):
+        """
+        :param root: Path to the root folder.
+        :param prune: Function that takes the path of a folder and returns True if it must not be watched.
+        :raise OSError: If the inotify API is not available.
+
+        """
+        from ctypes import CDLL, c_char_p, c_int, c_uint32, get_errno
+        from ctypes.util import find_library
+        from struct import Struct
+
+        if not sys.platform.startswith('linux'):
+            raise OSError('The inotify API is not available.')
+
+        try:
+            libc = CDLL(find_library('c'), use_errno=True)
+            self._add_watch = libc.inotify_add_watch
+            self._init = libc.inotify_init1
+        except (OSError, AttributeError, TypeError):
+            raise OSError('The inotify API is not available.')
+
+        self._add_watch.argtypes, self._add_watch.restype = (c_int, c_char_p, c_uint32), c_int
+        self._get_errno = get_errno
+        self._event = Struct('iIII')
+        self._descriptor = self._init(_IN_NONBLOCK | _IN_CLOEXEC)
+
+        if self._descriptor == -1:
+            raise OSError(self._get_errno(), 'Failed to initialize inotify.')
+
+        self._root = root
+        self._prune = prune
+        self._dirs = {}
+        self._drained = time_ns()
+        self._add_tree(root, None)
+
+    def read(self, timeout: float | None) -> list[tuple[str, bool]]:
+        """
+        Waits for the events of the watched folders.
+        :param timeout: Maximum waiting time in seconds (None means waiting for the first event).
+        :return: List of the pairs of a file path and whether the file is new (False if it was only written).
+
+        """
+        from os import fsdecode, read
+        from select import select
+
+        events = []
+
+        if not select([self._descriptor], [], [], timeout)[0]:
+            return events
+
+        while True:
+            try:
+                data = read(self._descriptor, _READ_SIZE)
+            except BlockingIOError:
+                self._drained = time_ns()
+                return events
+
+            offset = 0
+
+            while offset < len(data):
+                descriptor, mask, _, length = self._event.unpack_from(data, offset)
+                name = data[offset + self._event.size:offset + self._event.size + length].rstrip(b'\0')
+                offset += self._event.size + length
+                directory = self._dirs.get(descriptor)
+
+                if mask & _IN_Q_OVERFLOW:
+                    # The events that did not fit into the queue (e.g. of a huge checkout) are lost, so the tree is
+                    # rescanned for the files changed since the queue was last drained, and the new folders are
+                    # watched.
+                    self._add_tree(self._root, events, self._drained - _OVERFLOW_MARGIN)
+                elif mask & _IN_IGNORED:
+                    self._dirs.pop(descriptor, None)
+                elif directory is None:
+                    continue
+                elif mask & _IN_ISDIR:
+                    if mask & (_IN_CREATE | _IN_MOVED_TO):
+                        self._add_tree(join(directory, fsdecode(name)), events)
+                else:
+                    events.append((join(directory, fsdecode(name)),
+                                   not mask & _IN_CLOSE_WRITE))
+
+    def close(self) -> None:
+        """
+        Stops watching.
+
+        """
+        from os import close
+
+        if self._descriptor != -1:
+            close(self._descriptor)
+            self._descriptor = -1
+
+    def _add_tree(self, root: str, events: list | None, since: int | None = None) -> None:
+        # Watches the folder and its subfolders (adding a watch to a watched folder only returns its descriptor). The
+        # files that are already in a new folder (e.g. moved in with it, or created before its watch was added) are
+        # added to the events as new, unless there are no events (the initial tree), or only the files changed since
+        # the specified time (in nanoseconds) if it is specified.
+        from os import fsencode
+
+        stack = [root]
+
+        while stack:
+            directory = stack.pop()
+
+            if self._prune is not None and self._prune(directory):
+                continue
+
+            descriptor = self._add_watch(self._descriptor, fsencode(directory), _WATCH_MASK)
+
+            if descriptor == -1:
+                continue
+
+            self._dirs[descriptor] = directory
+
+            try:
+                with scandir(directory) as iterator:
+                    for entry in iterator:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif events is not None and entry.is_file() and \
+                                (since is None or entry.stat().st_ctime_ns >= since):
+                            events.append((entry.path, True))
+            except OSError:
+                continue
+
+
+class PollingWatcher:
+    """
+    Watcher of the new files in a folder tree that rescans it at a fixed interval. A file is new if its path or its
+    inode has appeared since the previous scan, so a file that is removed and created again within one interval is
+    only seen as written if the file system reuses its inode.
+    """
+    def __init__(self, root: str, prune=None, interval: float = 1.0):
+        """
+        :param root: Path to the root folder.
+        :param prune: Function that takes the path of a folder and returns True if it must not be watched.
+        :param interval: Interval between the rescans in seconds.
+
+        """
+        self._root = root
+        self._prune = prune
+        self._interval = interval
+        self._files = self._scan()
+
+    def read(self, timeout: float | None) -> list[tuple[str, bool]]:
+        """
+        Waits for the next rescan (or the timeout, if it is shorter) and compares the files with the previous scan.
+        :param timeout: Maximum waiting time in seconds (None means waiting for the next rescan).
+        :return: List of the pairs of a file path and whether the file is new (False if it was only written).
+
+        """
+        sleep(self._interval if timeout is None else min(timeout, self._interval))
+        files = self._scan()
+        # A file is new if it was not there or is another file now (e.g. removed and created again between the scans).
+        events = [(path, path not in self._files or self._files[path][0] != state[0]) for path, state in files.items()
+                  if self._files.get(path) != state]
+        self._files = files
+
+        return events
+
+    def close(self) -> None:
+        """
+        Stops watching.
+
+        """
+        self._files = {}
+
+    def _scan(self) -> dict[str, tuple[int, int, int]]:
+        files, stack = {}, [self._root]
+
+        while stack:
+            directory = stack.pop()
+
+            if self._prune is not None and self._prune(directory):
+                continue
+
+            try:
+                with scandir(directory) as iterator:
+                    for entry in iterator:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file():
+                            status = entry.stat()
+                            files[entry.path] = entry.inode(), status.st_size, status.st_mtime_ns
+            except OSError:
+                continue
+
+        return files
+
+# endregion
+
+
+# region Methods
+
+def watch(root: str, prune=None, debounce: float = 0.5, polling: bool = False, interval: float = 1.0):
+    """
+    Watches the specified folder tree for new files, with inotify if it is available (and polling is not forced).
+    The new files are collected until no new file appears and none of them is written for the debounce time, so
+    a burst of events (e.g. a checkout or a file being written in parts) is reported as one batch.
+    :param root: Path to the root folder.
+    :param prune: Function that takes the path of a folder and returns True if it must not be watched.
+    :param debounce: Time in seconds without new events after which the collected files are reported.
+    :param polling: Rescan the tree instead of using inotify.
+    :param interval: Interval between the rescans in seconds (only when polling).
+    :return: Generator of the lists of the new files (it runs until it is closed).
+
+    """
+    watcher = None
+
+    if not polling:
+        try:
+            watcher = InotifyWatcher(root, prune)
+        except OSError:
+            pass
+
+    if watcher is None:
+        watcher = PollingWatcher(root, prune, interval)
+
+    pending, last = {}, 0.0
+
+    try:
+        while True:
+            timeout = max(0.0, last + debounce - monotonic()) if pending else None
+
+            for path, created in watcher.read(timeout):
+                if created or path in pending:
+                    pending[path] = None
+                    last = monotonic()
+
+            if pending and monotonic() - last >= debounce:
+                yield list(pending)
+                pending = {}
+    finally:
+        watcher.close()
+
+# endregion
@@ -13,8 +13,62 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
-from iltshell import Shell
+"""
+Entry point of the "ilt" application.
+
+Without arguments, the interactive shell is started. Otherwise, the arguments are run as a single shell command
+(e.g. "main.py auto mit C:\\Code 2023 imlystyi ''") or "main.py --script <path>" runs every line of the specified file
+as a shell command in one process. The exit code is 1 if any command reported an error.
+
+"""
+import sys
+
+_SCRIPT_KEY = '--script'
+
+
+def main(argv: list[str]) -> int:
+    """
+    Runs the "ilt" application.
+    :param argv: Command line arguments (without the program name).
+    :return: Exit code.
+
+    """
+    from iltshell import Shell
+
+    shell = Shell()
+
+    if len(argv) == 0:
+        shell.cmdloop()
+    elif argv[0] == _SCRIPT_KEY:
+        if len(argv) != 2:
+            shell.default(f'The "{_SCRIPT_KEY}" key requires exactly one path.', Shell._MessageType.ERROR)
+            return 1
+
+        try:
+            with open(argv[1], encoding='utf-8') as script:
+                for line in script:
+                    line = line.strip()
+
+                    if line and not line.startswith('#'):
+                        shell.onecmd(line)
+        except (OSError, IOError):
+            shell.default(f'Failed file access: {argv[1]} (OSError/IOError).', Shell._MessageType.ERROR)
+    else:
+        shell.onecmd(' '.join(_quote(arg) for arg in argv))
+
+    return 1 if shell.errors > 0 else 0
+
+
+def _quote(arg: str) -> str:
+    # The shell splits its input by whitespace, except inside double quotes, and a quoted argument is always
+    # a parameter (an empty one too), never a key. The value of a key is quoted after "=" instead.
+    if arg.startswith('-'):
+        name, separator, value = arg.partition('=')
+
+        return f'{name}="{value}"' if separator and any(char.isspace() for char in value) else arg
+
+    return f'"{arg}"' if not arg or any(char.isspace() for char in arg) else arg
 
 
 if __name__ == '__main__':
-    Shell().cmdloop()
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,240 @@
+# ilt - insert license text
+# Copyright (C) 2023  imlystyi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Benchmarks of the "ilt" application on reproducible synthetic source trees.
+
+Every benchmark runs in a separate process (so its peak RSS is its own) on a freshly generated tree, and the results
+are printed (or written) as JSON that can be compared between versions:
+    python iltbench.py --files 20000 --repeat 3 --output before.json
+
+"""
+import json
+import platform
+import sys
+from argparse import ArgumentParser
+from os import makedirs
+from os.path import abspath, dirname, getsize, join, splitext
+from random import Random
+from shutil import rmtree
+from subprocess import run
+from tempfile import mkdtemp
+from time import perf_counter
+
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'application'))
+
+import iltlib as lib
+
+try:
+    from resource import RUSAGE_SELF, getrusage
+except ImportError:  # Not available on Windows.
+    getrusage = None
+
+# region Fields
+
+BENCHMARKS = ('get_files', 'get_license_text', 'special_file_insert', 'auto_insert', 'auto_insert_durable',
+              'special_ext_insert')
+"""
+Names of the available benchmarks.
+"""
+
+IGNORED_DIR = 'node_modules'
+"""
+Name of the directories that are generated to be ignored.
+"""
+
+_WORDS = ('value', 'result', 'index', 'count', 'buffer', 'items', 'config', 'return', 'if', 'for', 'while', 'name')
+"""
+Words from which the lines of the generated files are made.
+"""
+
+# endregion
+
+
+# region Methods
+
+def generate_tree(root: str, files: int, depth: int, min_size: int, max_size: int, exts: dict[str, int],
+                  ignored_fraction: float, seed: int) -> (int, int):
+    """
+    Generates a reproducible synthetic source tree.
+    :param root: Path to the root folder of the tree.
+    :param files: Number of generated files.
+    :param depth: Maximum depth of the directories.
+    :param min_size: Minimum size of a file in bytes.
+    :param max_size: Maximum size of a file in bytes (sizes are log-uniformly distributed).
+    :param exts: Dictionary of the file extensions and their weights.
+    :param ignored_fraction: Fraction of files that are placed into the ignored directories.
+    :param seed: Seed of the random generator.
+    :return: Tuple pair from the number of generated files and their total size in bytes.
+
+    """
+    random = Random(seed)
+    names, weights = list(exts), list(exts.values())
+    total = 0
+
+    for index in range(files):
+        parts = [f'd{random.randrange(8)}' for _ in range(random.randint(0, depth))]
+
+        if random.random() < ignored_fraction:
+            parts.insert(random.randint(0, len(parts)), IGNORED_DIR)
+
+        folder = join(root, *parts)
+        makedirs(folder, exist_ok=True)
+
+        size = int(min_size * (max_size / min_size) ** random.random())
+        line = ' '.join(random.choice(_WORDS) for _ in range(8)) + '\n'
+        content = (line * (size // len(line) + 1))[:size].encode()
+
+        with open(join(folder, f'f{index}{random.choices(names, weights)[0]}'), 'wb') as file:
+            file.write(content)
+
+        total += size
+
+    return files, total
+
+
+def run_benchmark(name: str, root: str, options) -> dict:
+    """
+    Runs the benchmark with the specified name on the generated tree.
+    :param name: Benchmark name.
+    :param root: Path to the root folder of the generated tree.
+    :param options: Parsed command line options.
+    :return: Dictionary of the measurements (for "get_license_text", "files" are the rendered license texts).
+
+    """
+    license_text = lib.get_license_text(options.license, 2023, 'ilt benchmark', 'ilt benchmark')
+    ignored = [IGNORED_DIR]
+    ext = max(options.exts, key=options.exts.get)
+    # The sizes of the inserted files are measured before the insertion, and the paths are not kept (except for the
+    # benchmark that needs them), so the peak RSS is the one of the benchmark itself.
+    selectors = {'special_file_insert': lambda file: True,
+                 'auto_insert': lambda file: lib._get_comment(file, splitext(file)[1]) != '',
+                 'auto_insert_durable': lambda file: lib._get_comment(file, splitext(file)[1]) != '',
+                 'special_ext_insert': lambda file: splitext(file)[1] == ext}
+    selector = selectors.get(name)
+    size = sum(getsize(file) for file in lib._get_files(root, ignored) if selector(file)) if selector else 0
+    files = list(lib._get_files(root, ignored)) if name == 'special_file_insert' else None
+
+    start = perf_counter()
+
+    match name:
+        case 'get_files':
+            items = sum(1 for _ in lib._get_files(root, ignored))
+        case 'get_license_text':
+            items = options.files
+
+            for index in range(items):
+                lib.get_license_text(options.license, 2000 + index % 50, 'ilt benchmark', 'ilt benchmark')
+        case 'special_file_insert':
+            items = len(files)
+
+            for file in files:
+                lib.special_file_insert(license_text, file, '#')
+        case 'auto_insert':
+            success, _, _, _ = lib.auto_insert(license_text, root, None, ignored, options.workers)
+            items = len(success)
+        case 'auto_insert_durable':
+            success, _, _, _ = lib.auto_insert(license_text, root, None, ignored, options.workers,
+                                               run_journal=join(root, lib.RUN_JOURNAL_NAME))
+            items = len(success)
+        case 'special_ext_insert':
+            success, _, _ = lib.special_ext_insert(license_text, root, ext, '#', ignored, options.workers)
+            items = len(success)
+        case _:
+            raise ValueError(f'Unknown benchmark: {name}.')
+
+    seconds = perf_counter() - start
+
+    return {'seconds': seconds, 'files': items, 'bytes': size,
+            'files_per_sec': items / seconds if seconds else None,
+            'mb_per_sec': size / seconds / 1024 ** 2 if seconds else None,
+            'peak_rss_kb': getrusage(RUSAGE_SELF).ru_maxrss if getrusage else None}
+
+
+def main(argv: list[str] = None) -> None:
+    """
+    Entry point of the benchmarks.
+    :param argv: Command line arguments.
+
+    """
+    parser = ArgumentParser(description='Benchmarks of the "ilt" application.')
+    parser.add_argument('--files', type=int, default=2000, help='number of generated files')
+    parser.add_argument('--depth', type=int, default=4, help='maximum depth of the generated directories')
+    parser.add_argument('--min-size', type=int, default=256, help='minimum size of a generated file in bytes')
+    parser.add_argument('--max-size', type=int, default=64 * 1024, help='maximum size of a generated file in bytes')
+    parser.add_argument('--exts', type=_parse_exts, default=_parse_exts('.py:4,.c:2,.js:2,.md:1,.json:1'),
+                        help='extensions and their weights, e.g. ".py:4,.md:1"')
+    parser.add_argument('--ignored-fraction', type=float, default=0.1,
+                        help=f'fraction of files generated inside "{IGNORED_DIR}" directories')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the tree generator')
+    parser.add_argument('--license', default='gpl3', help='name of the inserted license')
+    parser.add_argument('--workers', type=int, default=1, help='number of parallel workers')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs of each benchmark (the best is kept)')
+    parser.add_argument('--bench', nargs='+', choices=BENCHMARKS, default=BENCHMARKS, help='benchmarks to run')
+    parser.add_argument('--output', help='path to the JSON output file (printed if omitted)')
+    parser.add_argument('--run-one', help='internal: run a single benchmark in this process')
+    options = parser.parse_args(argv)
+
+    if options.run_one is not None:
+        name, root = options.run_one.split(':', 1)
+        print(json.dumps(run_benchmark(name, root, options)))
+        return
+
+    results = {}
+
+    for name in options.bench:
+        runs = []
+
+        for _ in range(options.repeat):
+            root = mkdtemp(prefix='iltbench-')
+
+            try:
+                generate_tree(root, options.files, options.depth, options.min_size, options.max_size, options.exts,
+                              options.ignored_fraction, options.seed)
+                arguments = list(argv if argv is not None else sys.argv[1:])
+                process = run([sys.executable, abspath(__file__), *arguments, '--run-one', f'{name}:{root}'],
+                              capture_output=True, text=True, check=True)
+                runs.append(json.loads(process.stdout))
+            finally:
+                rmtree(root, ignore_errors=True)
+
+        results[name] = min(runs, key=lambda result: result['seconds'])
+
+    report = json.dumps({'python': platform.python_version(), 'platform': platform.platform(),
+                         'parameters': {key: value for key, value in vars(options).items()
+                                        if key not in ('output', 'run_one', 'bench')},
+                         'results': results}, indent=2)
+
+    if options.output is None:
+        print(report)
+    else:
+        with open(options.output, 'w', encoding='utf-8') as file:
+            file.write(report + '\n')
+
+
+def _parse_exts(value: str) -> dict[str, int]:
+    exts = {}
+
+    for item in value.split(','):
+        ext, _, weight = item.partition(':')
+        exts[ext.strip()] = int(weight or 1)
+
+    return exts
+
+# endregion
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+# ilt - insert license text
+# Copyright (C) 2023  imlystyi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Table-driven tests of the gitignore-style matching of the "iltignore" module.
+
+Run with "python -m unittest discover tests" (or pytest) from the repository root.
+
+"""
+import sys
+import unittest
+from os.path import abspath, dirname, join
+
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'application'))
+
+from iltignore import IgnoreMatcher, is_ignored
+
+# region Fields
+
+MATCH_CASES = (
+    # Literal names match at any depth, files and folders alike.
+    (['build'], 'build', True, True),
+    (['build'], 'src/build', False, True),
+    (['build'], 'src/builder', False, None),
+    # Extension suffixes (the fast path) match at any dot of the name.
+    (['*.js'], 'app.js', False, True),
+    (['*.js'], 'lib/app.min.js', False, True),
+    (['*.js'], 'app.jsx', False, None),
+    (['*.min.js'], 'lib/app.min.js', False, True),
+    (['*.min.js'], 'lib/app.js', False, None),
+    (['*.js'], '.js', False, True),
+    # Other suffixes go through the regular expression.
+    (['*~'], 'foo.py~', False, True),
+    (['*~'], 'dir/notes~', False, True),
+    (['*~'], 'foo.py', False, None),
+    (['*_test.go'], 'x/foo_test.go', False, True),
+    (['*_test.go'], 'x/foo.go', False, None),
+    (['*-lock.json'], 'package-lock.json', False, True),
+    # Wildcards do not cross folders.
+    (['a*c'], 'abc', False, True),
+    (['a*c'], 'a/c', False, None),
+    (['file?.txt'], 'file1.txt', False, True),
+    (['file?.txt'], 'file10.txt', False, None),
+    (['[abc].py'], 'b.py', False, True),
+    (['[!abc].py'], 'b.py', False, None),
+    (['[!abc].py'], 'd.py', False, True),
+    # Directory-only patterns.
+    (['build/'], 'build', True, True),
+    (['build/'], 'build', False, None),
+    (['*.d/'], 'conf.d', True, True),
+    (['*.d/'], 'conf.d', False, None),
+    # Anchoring: a pattern with a "/" (other than a trailing one) is relative to the base folder.
+    (['/build'], 'build', True, True),
+    (['/build'], 'src/build', True, None),
+    (['docs/gen'], 'docs/gen', True, True),
+    (['docs/gen'], 'src/docs/gen', True, None),
+    (['docs/*.md'], 'docs/a.md', False, True),
+    (['docs/*.md'], 'docs/sub/a.md', False, None),
+    # "**" matches any number of folders.
+    (['**/gen'], 'a/b/gen', True, True),
+    (['**/gen/**'], 'a/gen/b/c.py', False, True),
+    (['**/gen/**'], 'a/generated/c.py', False, None),
+    (['a/**/b'], 'a/b', True, True),
+    (['a/**/b'], 'a/x/y/b', True, True),
+    (['a/**/b'], 'x/a/b', True, None),
+    (['logs/**'], 'logs/2023/app.log', False, True),
+    # Negation and precedence: the last matching pattern wins, whichever kind it is.
+    (['*.log', '!keep.log'], 'keep.log', False, False),
+    (['*.log', '!keep.log'], 'other.log', False, True),
+    (['!keep.log', '*.log'], 'keep.log', False, True),
+    (['*.min.js', '!keep.min.js'], 'lib/keep.min.js', False, False),
+    (['build', '!build/'], 'build', True, False),
+    (['build', '!build/'], 'build', False, True),
+    (['gen*', '!gen_keep', 'gen_keep'], 'gen_keep', False, True),
+    (['*~', '!keep~'], 'keep~', False, False),
+    # Comments, blank lines, escapes and trailing spaces.
+    (['# build', '', '   '], 'build', True, None),
+    (['\\#notes'], '#notes', False, True),
+    (['\\!important'], '!important', False, True),
+    (['build   '], 'build', True, True),
+)
+"""
+Cases of a single matcher: the patterns, the path, whether it is a folder and the expected result of "match" (True if
+ignored, False if re-included, None if no pattern matches).
+"""
+
+BASE_CASES = (
+    # The patterns of a nested ".gitignore" file are relative to its folder.
+    (['*.py'], 'src/', 'src/a.py', False, True),
+    (['*.py'], 'src/', 'a.py', False, None),
+    (['/build'], 'src/', 'src/build', True, True),
+    (['/build'], 'src/', 'src/x/build', True, None),
+    (['x/y'], 'src/', 'src/x/y', True, True),
+)
+"""
+Cases of a matcher with a base folder: the patterns, the base, the path, whether it is a folder and the expected
+result of "match".
+"""
+
+CHAIN_CASES = (
+    # A later (deeper) matcher takes precedence over an earlier one, and a path no one matches is not ignored.
+    ((['*.log'], ''), (['!keep.log'], 'src/'), 'src/keep.log', False),
+    ((['*.log'], ''), (['!keep.log'], 'src/'), 'keep.log', True),
+    ((['!*.log'], ''), (['*.log'], 'src/'), 'src/a.log', True),
+    ((['build'], ''), (['*.py'], 'src/'), 'src/main.c', False),
+)
+"""
+Cases of a chain of matchers: the patterns and the base of the first and the second matcher, the path (a file) and
+whether it is expected to be ignored.
+"""
+
+# endregion
+
+
+# region Classes
+
+class IgnoreMatcherTest(unittest.TestCase):
+    """
+    Tests of "IgnoreMatcher" and "is_ignored".
+    """
+    def test_match(self):
+        for patterns, path, is_dir, expected in MATCH_CASES:
+            with self.subTest(patterns=patterns, path=path, is_dir=is_dir):
+                self.assertIs(IgnoreMatcher(patterns).match(path, is_dir), expected)
+
+    def test_base(self):
+        for patterns, base, path, is_dir, expected in BASE_CASES:
+            with self.subTest(patterns=patterns, base=base, path=path):
+                self.assertIs(IgnoreMatcher(patterns, base).match(path, is_dir), expected)
+
+    def test_chain(self):
+        for first, second, path, expected in CHAIN_CASES:
+            with self.subTest(first=first, second=second, path=path):
+                matchers = IgnoreMatcher(*first), IgnoreMatcher(*second)
+                self.assertIs(is_ignored(matchers, path, False), expected)
+
+# endregion
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,313 @@
+# ilt - insert license text
+# Copyright (C) 2023  imlystyi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Behaviour tests of the "iltlib" module, which run the real functions on temporary trees.
+
+Run with "python -m unittest discover tests" (or pytest) from the repository root.
+
+"""
+import sys
+import unittest
+from os import link, listdir, makedirs, stat, symlink
+from os.path import abspath, dirname, isfile, islink, join
+from tempfile import TemporaryDirectory
+
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'application'))
+
+import iltlib as lib
+
+# region Fields
+
+LICENSE_TEXT = lib.get_license_text('mit', 2023, 'imlystyi')
+"""
+License text inserted by the tests.
+"""
+
+HEADER = lib._render_header(LICENSE_TEXT, '#')
+"""
+Header of the license text in the files with "#" comments and "\\n" line endings.
+"""
+
+UTF8_BOM, UTF16_BOM = b'\xef\xbb\xbf', b'\xff\xfe'
+"""
+Byte order marks of UTF-8 and UTF-16-LE.
+"""
+
+INSERT_CASES = (
+    # The line endings of the file are matched.
+    (b'', '#', (b'', 'utf-8', '\n'), b''),
+    (b'x = 1\n', '#', (b'', 'utf-8', '\n'), b'x = 1\n'),
+    (b'x = 1\r\ny = 2\r\n', '#', (b'', 'utf-8', '\r\n'), b'x = 1\r\ny = 2\r\n'),
+    (b'x = 1\ry = 2\r', '#', (b'', 'utf-8', '\r'), b'x = 1\ry = 2\r'),
+    # The header follows the byte order mark in the encoding of the file.
+    (UTF8_BOM + b'x = 1\n', '#', (UTF8_BOM, 'utf-8', '\n'), b'x = 1\n'),
+    (UTF16_BOM + 'x = 1\r\n'.encode('utf-16-le'), '#', (UTF16_BOM, 'utf-16-le', '\r\n'),
+     'x = 1\r\n'.encode('utf-16-le')),
+    # The header follows the shebang line, which is ended first if it has no line ending.
+    (b'#!/usr/bin/env python\nx = 1\n', '#', (b'#!/usr/bin/env python\n', 'utf-8', '\n'), b'x = 1\n'),
+    (UTF8_BOM + b'#!/bin/sh\r\necho\r\n', '#', (UTF8_BOM + b'#!/bin/sh\r\n', 'utf-8', '\r\n'), b'echo\r\n'),
+    (b'#!/bin/sh', '#', (b'#!/bin/sh\n', 'utf-8', '\n'), b''),
+    # Rust inner attributes are not shebang lines.
+    (b'#![no_std]\nfn main() {}\n', '//', (b'', 'utf-8', '\n'), b'#![no_std]\nfn main() {}\n'),
+)
+"""
+Cases of the insertion: the original bytes, the comment format, the expected bytes before the header, the encoding
+and the line ending of the header, and the expected bytes after it.
+"""
+
+SKIP_CASES = (
+    (b'\x7fELF\x02\x01\x01\0', lib.BINARY),
+    (b'x = 1\0\n', lib.BINARY),
+    (b'# Code generated by protoc. DO NOT EDIT.\nx = 1\n', lib.GENERATED),
+    (b'# @generated\nx = 1\n', lib.GENERATED),
+    (b'# do not edit this constant\nx = 1\n', lib.INSERTED),
+)
+"""
+Cases of the sniffing of the files: the original bytes and the expected status of "auto_insert".
+"""
+
+# endregion
+
+
+# region Classes
+
+class TreeTestCase(unittest.TestCase):
+    """
+    Base of the tests that run on a temporary tree.
+    """
+    def setUp(self):
+        self._directory = TemporaryDirectory()
+        self.root = self._directory.name
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def write(self, path: str, data: bytes) -> str:
+        path = join(self.root, path)
+        makedirs(dirname(path), exist_ok=True)
+
+        with open(path, 'wb') as io:
+            io.write(data)
+
+        return path
+
+    def read(self, path: str) -> bytes:
+        with open(join(self.root, path), 'rb') as io:
+            return io.read()
+
+    def link(self, path: str, target: str) -> str:
+        path = join(self.root, path)
+
+        try:
+            symlink(target, path)
+        except (OSError, NotImplementedError):
+            self.skipTest('Symbolic links are not available.')
+
+        return path
+
+    def temporary_files(self) -> list[str]:
+        return [name for name in listdir(self.root) if lib._is_temporary(name)]
+
+
+class InsertTest(TreeTestCase):
+    """
+    Tests of the byte-level insertion.
+    """
+    def test_insert(self):
+        for data, comment, (before, encoding, newline), after in INSERT_CASES:
+            with self.subTest(data=data, comment=comment):
+                file = self.write('a.py', data)
+
+                self.assertTrue(lib.special_file_insert(LICENSE_TEXT, file, comment, True))
+                self.assertEqual(self.read('a.py'),
+                                 before + lib._render_header(LICENSE_TEXT, comment, encoding, newline) + after)
+                self.assertFalse(lib.special_file_insert(LICENSE_TEXT, file, comment, True))
+                self.assertEqual(self.temporary_files(), [])
+
+    def test_sniff(self):
+        for data, status in SKIP_CASES:
+            with self.subTest(data=data):
+                self.root = join(self._directory.name, str(len(data)))
+                self.write('a.py', data)
+                success, _, non_text, _ = lib.auto_insert(LICENSE_TEXT, self.root)
+
+                if status == lib.INSERTED:
+                    self.assertEqual(success, [join(self.root, 'a.py')])
+                else:
+                    self.assertEqual(non_text, [(join(self.root, 'a.py'), status)])
+                    self.assertEqual(self.read('a.py'), data)
+
+    def test_mirror(self):
+        self.write('src/a.py', b'x = 1\n')
+        self.write('src/notes.unknown', b'text\n')
+        lib.auto_insert(LICENSE_TEXT, join(self.root, 'src'), output=join(self.root, 'out'))
+
+        self.assertEqual(self.read('src/a.py'), b'x = 1\n')
+        self.assertEqual(self.read('out/a.py'), HEADER + b'x = 1\n')
+        self.assertEqual(self.read('out/notes.unknown'), b'text\n')
+
+    def test_symbolic_link(self):
+        self.write('b.py', b'x = 1\n')
+        lib.special_file_insert(LICENSE_TEXT, self.link('a.py', 'b.py'), '#')
+
+        self.assertTrue(islink(join(self.root, 'a.py')))
+        self.assertEqual(self.read('b.py'), HEADER + b'x = 1\n')
+
+
+class UpdateTest(TreeTestCase):
+    """
+    Tests of "update_headers" (with the GPL, whose header holds the year and the copyright holder).
+    """
+    def header(self, year: int, copyright_holder: str, newline: str = '\n') -> bytes:
+        return lib._render_header(lib.get_license_text('gpl3', year, copyright_holder), '#', newline=newline)
+
+    def test_header_of_same_length(self):
+        # The header is patched in place, so the file keeps its inode.
+        file = self.write('a.py', self.header(2022, 'imlystyi') + b'x = 1\n')
+        inode = stat(file).st_ino
+        updated, valid, unlicensed = lib.update_headers('gpl3', self.root, 2023, 'imlystyi')
+
+        self.assertEqual((updated, valid, unlicensed), ([file], [], []))
+        self.assertEqual(self.read('a.py'), self.header(2023, 'imlystyi') + b'x = 1\n')
+        self.assertEqual(stat(file).st_ino, inode)
+
+    def test_header_of_other_length(self):
+        # The file is rewritten with the body copied verbatim (here with CRLF line endings and a shebang line).
+        body = b''.join(b'line %d\r\n' % index for index in range(100_000))
+        file = self.write('a.py', b'#!/usr/bin/env python\r\n' + self.header(2023, 'someone else', '\r\n') + body)
+        updated, _, _ = lib.update_headers('gpl3', self.root, 2023, 'imlystyi')
+
+        self.assertEqual(updated, [file])
+        self.assertEqual(self.read('a.py'), b'#!/usr/bin/env python\r\n' + self.header(2023, 'imlystyi', '\r\n') + body)
+        self.assertEqual(self.temporary_files(), [])
+
+    def test_valid_and_unlicensed(self):
+        valid = self.write('a.py', self.header(2023, 'imlystyi') + b'x = 1\n')
+        unlicensed = self.write('b.py', b'x = 1\n')
+
+        self.assertEqual(lib.update_headers('gpl3', self.root, 2023, 'imlystyi'), ([], [valid], [unlicensed]))
+        self.assertEqual(self.read('b.py'), b'x = 1\n')
+
+
+class UndoTest(TreeTestCase):
+    """
+    Tests of "undo_journal".
+    """
+    def test_round_trip(self):
+        journal = join(self.root, lib.JOURNAL_NAME)
+
+        for index, (data, _, _, _) in enumerate(INSERT_CASES):
+            self.write(f'{index}/a.py', data)
+
+        lib.auto_insert(LICENSE_TEXT, self.root, journal=journal)
+        restored, failed = lib.undo_journal(journal)
+
+        self.assertEqual((len(restored), failed), (len(INSERT_CASES), []))
+        self.assertTrue(all(self.read(f'{index}/a.py') == data for index, (data, _, _, _) in enumerate(INSERT_CASES)))
+        self.assertFalse(isfile(journal))
+
+    def test_changed_header(self):
+        # Only a header that is still in place is stripped, and the journal is kept for the files left as they are.
+        journal = join(self.root, lib.JOURNAL_NAME)
+        self.write('a.py', b'x = 1\n')
+        self.write('b.py', b'y = 2\n')
+        lib.auto_insert(LICENSE_TEXT, self.root, journal=journal)
+        changed = b'# edited\n' + self.read('b.py')
+        self.write('b.py', changed)
+        restored, failed = lib.undo_journal(journal)
+
+        self.assertEqual((restored, failed), ([join(self.root, 'a.py')], [join(self.root, 'b.py')]))
+        self.assertEqual(self.read('a.py'), b'x = 1\n')
+        self.assertEqual(self.read('b.py'), changed)
+        self.assertTrue(isfile(journal))
+
+    def test_truncated_file(self):
+        journal = join(self.root, lib.JOURNAL_NAME)
+        self.write('a.py', b'x = 1\n')
+        lib.auto_insert(LICENSE_TEXT, self.root, journal=journal)
+        self.write('a.py', HEADER[:10])
+
+        self.assertEqual(lib.undo_journal(journal), ([], [join(self.root, 'a.py')]))
+        self.assertEqual(self.read('a.py'), HEADER[:10])
+
+
+class DurableTest(TreeTestCase):
+    """
+    Tests of the durable mode (the run journal).
+    """
+    def test_symbolic_link_and_target(self):
+        for workers in (1, 4):
+            with self.subTest(workers=workers):
+                self.root = join(self._directory.name, str(workers))
+                self.write('b.py', b'print(1)\n')
+                self.link('a.py', 'b.py')
+
+                for index in range(20):
+                    self.write(f'f{index}.py', b'x = 1\n')
+                    self.link(f'l{index}.py', f'f{index}.py')
+
+                success, skipped, _, _ = lib.auto_insert(LICENSE_TEXT, self.root, workers=workers,
+                                                         run_journal=join(self.root, lib.RUN_JOURNAL_NAME))
+
+                self.assertEqual(len(success), 21)
+                self.assertEqual(len(skipped), 21)
+                self.assertEqual(self.read('b.py'), HEADER + b'print(1)\n')
+                self.assertTrue(all(self.read(f'f{index}.py') == HEADER + b'x = 1\n' for index in range(20)))
+                self.assertTrue(islink(join(self.root, 'a.py')))
+                self.assertEqual(self.temporary_files(), [])
+
+    def test_hard_links(self):
+        file = self.write('b.py', b'print(1)\n')
+        link(file, join(self.root, 'a.py'))
+        lib.auto_insert(LICENSE_TEXT, self.root, run_journal=join(self.root, lib.RUN_JOURNAL_NAME))
+
+        self.assertEqual(self.read('a.py'), HEADER + b'print(1)\n')
+        self.assertEqual(stat(file).st_nlink, 2)
+        self.assertEqual(self.temporary_files(), [])
+
+    def test_commit_paths_of_same_file(self):
+        file = self.write('b.py', b'print(1)\n')
+        link = self.link('a.py', 'b.py')
+        lib._prepend(file, 0, HEADER, staged=True)
+        lib._commit([file, link], 1)
+
+        self.assertEqual(self.read('b.py'), HEADER + b'print(1)\n')
+        self.assertEqual(self.temporary_files(), [])
+
+
+class ProgressTest(TreeTestCase):
+    """
+    Tests of the progress of "iter_auto_insert".
+    """
+    def test_progress(self):
+        self.write('a.py', b'x = 1\n')
+        self.write('sub/b.c', b'int x;\n')
+        self.write('notes.unknown', b'text\n')
+        progress, unknown_exts, totals = {}, {}, []
+
+        for _ in lib.iter_auto_insert(LICENSE_TEXT, self.root, unknown_exts=unknown_exts, progress=progress):
+            totals.append(progress['total'])
+
+        self.assertEqual(totals, [2, 2])
+        self.assertEqual(progress['files'], 2)
+        self.assertEqual(progress['bytes'], len(self.read('a.py')) + len(self.read('sub/b.c')))
+        self.assertEqual(unknown_exts, {'.unknown': [1, [join(self.root, 'notes.unknown')]]})
+
+# endregion
+
+
+if __name__ == '__main__':
+    unittest.main()
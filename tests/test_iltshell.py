@@ -0,0 +1,84 @@
+# ilt - insert license text
+# Copyright (C) 2023  imlystyi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Table-driven tests of the input parsing of the "iltshell" module.
+
+Run with "python -m unittest discover tests" (or pytest) from the repository root.
+
+"""
+import sys
+import unittest
+from io import StringIO
+from os.path import abspath, dirname, join
+
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'application'))
+
+from iltshell import Shell
+
+# region Fields
+
+PARSE_CASES = (
+    ('mit "C:\\Code" 2023', ('mit', 'C:\\Code', '2023'), []),
+    ('mit "" " - " -f -w=8', ('mit', '', ' - '), ['-f', '-w=8']),
+    ('mit "-d" -d', ('mit', '-d'), ['-d']),
+    ('mit -m="C:\\My Code\\manifest" -j', ('mit',), ['-m=C:\\My Code\\manifest', '-j']),
+    ('mit --report="/tmp/my dir/report.json" "x y"', ('mit', 'x y'), ['--report=/tmp/my dir/report.json']),
+    ('mit -m="" -o=out', ('mit',), ['-m=', '-o=out']),
+)
+"""
+Cases of the input parsing: the arguments of a command, the expected parameters and the expected keys.
+"""
+
+UNBALANCED_CASES = (
+    'auto mit "C:\\Code 2023',
+    'auto mit -m="/tmp/my dir/manifest -f',
+    'auto mit -m=/tmp/"my dir"/manifest',
+)
+"""
+Input lines with unbalanced double quotes.
+"""
+
+# endregion
+
+
+# region Classes
+
+class ShellParsingTest(unittest.TestCase):
+    """
+    Tests of the parameters and keys of the shell commands.
+    """
+    def test_parse(self):
+        shell = Shell()
+
+        for args, params, keys in PARSE_CASES:
+            with self.subTest(args=args):
+                self.assertEqual(shell._get_params_(args), params)
+                self.assertEqual(shell._get_keys(args), keys)
+
+    def test_unbalanced_quotes(self):
+        for line in UNBALANCED_CASES:
+            with self.subTest(line=line):
+                shell = Shell(stdout=StringIO())
+                shell.onecmd(line)
+
+                self.assertEqual(shell.errors, 1)
+                self.assertIn('Unbalanced double quotes.', shell.stdout.getvalue())
+
+# endregion
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+# ilt - insert license text
+# Copyright (C) 2023  imlystyi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Behaviour tests of the "iltwatch" module, which watch temporary trees.
+
+Run with "python -m unittest discover tests" (or pytest) from the repository root.
+
+"""
+import sys
+import unittest
+from os import makedirs
+from os.path import abspath, dirname, join
+from tempfile import TemporaryDirectory
+
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'application'))
+
+from iltwatch import InotifyWatcher, PollingWatcher
+
+# region Fields
+
+_MAX_QUEUED_EVENTS_PATH = '/proc/sys/fs/inotify/max_queued_events'
+"""
+Path of the limit of the queued inotify events (Linux).
+"""
+
+# endregion
+
+
+# region Classes
+
+class InotifyWatcherTest(unittest.TestCase):
+    """
+    Tests of "InotifyWatcher".
+    """
+    def setUp(self):
+        self._directory = TemporaryDirectory()
+        self.root = self._directory.name
+
+        try:
+            self.watcher = InotifyWatcher(self.root)
+        except OSError:
+            self._directory.cleanup()
+            self.skipTest('The inotify API is not available.')
+
+    def tearDown(self):
+        self.watcher.close()
+        self._directory.cleanup()
+
+    def test_new_files(self):
+        makedirs(join(self.root, 'sub'))
+        open(join(self.root, 'sub', 'a.py'), 'w').close()
+        open(join(self.root, 'b.py'), 'w').close()
+
+        self.assertEqual({path for path, created in self.watcher.read(1) if created},
+                         {join(self.root, 'sub', 'a.py'), join(self.root, 'b.py')})
+
+    def test_queue_overflow(self):
+        try:
+            with open(_MAX_QUEUED_EVENTS_PATH) as io:
+                count = int(io.read()) + 100
+        except (OSError, ValueError):
+            self.skipTest('The limit of the queued inotify events is not known.')
+
+        files = {join(self.root, f'f{index}.py') for index in range(count)}
+
+        for file in files:
+            open(file, 'w').close()
+
+        makedirs(join(self.root, 'sub'))
+        open(join(self.root, 'sub', 'late.py'), 'w').close()
+
+        self.assertEqual({path for path, created in self.watcher.read(1) if created},
+                         files | {join(self.root, 'sub', 'late.py')})
+
+
+class PollingWatcherTest(unittest.TestCase):
+    """
+    Tests of "PollingWatcher".
+    """
+    def test_new_and_written_files(self):
+        with TemporaryDirectory() as root:
+            old = join(root, 'old.py')
+            open(old, 'w').close()
+            watcher = PollingWatcher(root, interval=0.01)
+
+            with open(old, 'w') as io:
+                io.write('x = 1\n')
+
+            open(join(root, 'new.py'), 'w').close()
+
+            self.assertEqual(sorted(watcher.read(None)), [(join(root, 'new.py'), True), (old, False)])
+
+# endregion
+
+
+if __name__ == '__main__':
+    unittest.main()